@@ -2,6 +2,9 @@ import sublime
 import sublime_plugin
 import urllib.parse
 import urllib.request
+import http.client
+import contextlib
+import io
 import json
 import threading
 import socket
@@ -9,10 +12,254 @@ import re
 import time
 import os
 import hashlib
+import heapq
+import typing
 
 from datetime import datetime
 from .script_runner import ScriptRunner
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+_MODEL_SET_TMPL = "\n[Model set to: %s]\n"
+_MODEL_NOT_FOUND_TMPL = "\n[Error]: Model '%s' not found in settings.\n"
+_CURRENT_MODEL_TMPL = "\n[Current Model: %s]\n"
+_DEFAULT_MODEL_MSG = "\n[Using default model. /list to show models]\n"
+_STATUS_TMPL = "deepchat:%s"
+_DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant."
+_KB_PREFIX = "I have access to this knowledge base:\n\n"
+_FILE_REF_PREFIX = "File available: "
+_FILE_REF_SUFFIX = " (use view_file to read content)"
+_FUNCTIONS_PROMPT_USAGE = (
+    "\n\nTo call a function, use this format:"
+    "\n\n```"
+    "\n<toolfunction_call>"
+    "\n@command: function_name"
+    "\nshort_arg_name: value"
+    "\nmultiline_arg_name: <<<||"
+    "\nmultiline value here"
+    "\ncan have any characters"
+    "\n||>>>"
+    "\n</toolfunction_call>"
+    "\n```"
+    "\nIMPORTANT: function calls are executed after your turn. You MUST cut the answer and wait for user input after a call."
+    "\nIMPORTANT: Make sure if the call is read-only. If it's a read-only call, use <wait_function_return/> to request user to skip next input."
+    "\nRequest confirmation before create or edit files. Stop tool function attempts after 3 failures."
+)
+
+_SESSION_ID_SANITIZER = re.compile(r'[^\w\-]')
+_TOOLCALL_FIND = re.compile(r'<toolfunction_call>(.*?)</toolfunction_call>', re.DOTALL)
+_TOOLCALL_TRUNC100 = re.compile(r'<toolfunction_call>(.{0,100}).*?</toolfunction_call>', re.DOTALL)
+_TOOLCALL_TRUNC150 = re.compile(r'<toolfunction_call>(.{0,150}).*?</toolfunction_call>', re.DOTALL)
+_TOOLCALL_TRUNC_REPL = r'<toolfunction_call>\1...</toolfunction_call>'
+_CAMEL_SPLIT = re.compile(r'(?<!^)(?=[A-Z])')
+
+# Every other command only runs when typed on its own, so a prompt that
+# merely starts with one ("/clear the cache ...") still goes to the model
+_COMMANDS_WITH_TEXT = {'/new', '/testcall', '/read', '/model'}  # any text may follow
+_COMMANDS_WITH_ARG = {'/save', '/load', '/delete', '/rewind', '/label'}  # '/verb:argument'
+_COMMANDS_ARG_REQUIRED = {'/delete', '/rewind', '/label'}
+
+# Small deltas are held back until this much text is pending or it has
+# waited this long, so a token-by-token stream doesn't cost an append each
+_FLUSH_MIN_CHARS = 512
+_FLUSH_MAX_WAIT = 0.08
+
+_STREAM_HANG_TIMEOUT = 15  # seconds without data before a reply is cut off
+
+_window_status = {}  # window id -> status bar text
+_function_file_cache = {}  # functions file path -> (mtime_ns, {name: function info})
+
+def _preview(msg, limit):
+    """Short one-line-ish preview of a history message"""
+    content = msg.get('content', '')
+    if (msg.get('role') == 'system' and content.startswith(_FILE_REF_PREFIX)
+            and content.endswith(_FILE_REF_SUFFIX)):
+        # File references only need the path
+        return content[len(_FILE_REF_PREFIX):-len(_FILE_REF_SUFFIX)]
+    head = content[:limit + 1]
+    return head[:limit] + "..." if len(head) > limit else head
+
+#----------------------------------------------------------------
+_JSON_STRUCTURAL = re.compile(r'[{}"\\]')
+
+class _JsonObjectSplitter:
+    """Cut complete top-level JSON objects out of text arriving in pieces
+
+    Brace depth and string/escape state carry over between feed() calls, so
+    every character is looked at once no matter how many pieces an object
+    is split into.
+    """
+
+    def __init__(self):
+        self._parts = []  # pieces of the object still open
+        self._depth = 0
+        self._in_string = False
+        self._skip = 0  # 1 if the next piece starts with an escaped character
+
+    def feed(self, text):
+        """Add a piece of text and return the objects it completes"""
+        objects = []
+        parts = self._parts
+        depth = self._depth
+        in_string = self._in_string
+        skip = self._skip
+        begin = 0  # start of the open object within text
+
+        for match in _JSON_STRUCTURAL.finditer(text, skip):
+            i = match.start()
+            if i < skip:
+                continue
+            c = match.group()
+            if not depth:
+                # Anything between objects is ignored
+                if c == '{':
+                    depth = 1
+                    begin = i
+            elif in_string:
+                if c == '\\':
+                    skip = i + 2
+                elif c == '"':
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+                if not depth:
+                    parts.append(text[begin:i + 1])
+                    objects.append(''.join(parts))
+                    parts.clear()
+
+        if depth:
+            parts.append(text[begin:])
+        self._depth = depth
+        self._in_string = in_string
+        self._skip = max(skip - len(text), 0)
+        return objects
+
+#----------------------------------------------------------------
+# Keep-alive connections, reused across chat turns to skip the TCP/TLS handshake
+_MAX_IDLE_CONNECTIONS = 4
+# What a kept-alive socket the server already closed fails with, before any
+# response arrives. Anything else (timeouts in particular) may mean the
+# request got through, so it is never re-sent.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+_idle_connections = {}  # (scheme, netloc) -> [HTTPConnection]
+_connections_lock = threading.Lock()
+
+def _take_connection(scheme, netloc, timeout, fresh=False):
+    """Return (connection, reused) for host, preferring an idle kept-alive one"""
+    conn = None
+    if not fresh:
+        with _connections_lock:
+            idle = _idle_connections.get((scheme, netloc))
+            conn = idle.pop() if idle else None
+
+    if conn is not None:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    if scheme == 'https':
+        return http.client.HTTPSConnection(netloc, timeout=timeout), False
+    return http.client.HTTPConnection(netloc, timeout=timeout), False
+
+def _release_connection(scheme, netloc, conn):
+    """Park a connection whose response was fully read for the next request"""
+    with _connections_lock:
+        idle = _idle_connections.setdefault((scheme, netloc), [])
+        if len(idle) < _MAX_IDLE_CONNECTIONS:
+            idle.append(conn)
+            return
+    conn.close()
+
+@contextlib.contextmanager
+def _urlopen_keepalive(request, timeout=30):
+    """Drop-in for urllib.request.urlopen() that keeps the connection alive"""
+    if urllib.request.getproxies():
+        # Leave proxy handling to urllib
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            yield response
+        return
+
+    parts = urllib.parse.urlsplit(request.full_url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    headers = dict(request.header_items())
+
+    def send(conn):
+        try:
+            conn.request(request.get_method(), path, body=request.data, headers=headers)
+            return conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    conn, reused = _take_connection(parts.scheme, parts.netloc, timeout)
+    try:
+        response = send(conn)
+    except _STALE_CONNECTION_ERRORS:
+        if not reused:
+            raise
+        # The server dropped the idle connection - retry once on a fresh one
+        conn, _ = _take_connection(parts.scheme, parts.netloc, timeout, fresh=True)
+        response = send(conn)
+
+    if response.status >= 400:
+        body = response.read()
+        conn.close()
+        raise urllib.error.HTTPError(
+            request.full_url, response.status, response.reason,
+            response.headers, io.BytesIO(body))
+
+    try:
+        yield response
+    finally:
+        if response.isclosed() and not response.will_close:
+            _release_connection(parts.scheme, parts.netloc, conn)
+        else:
+            # Unread data left on the socket - it can't be reused
+            conn.close()
+
+#----------------------------------------------------------------
+class DeepChatAppendManyCommand(sublime_plugin.TextCommand):
+    """Append several chunks to the end of the view in a single edit"""
+    def run(self, edit, chunks):
+        pt = self.view.size()
+        for chunk in chunks:
+            self.view.insert(edit, pt, chunk)
+            pt += len(chunk)
+
+
+#----------------------------------------------------------------
+class DeepChatClearViewCommand(sublime_plugin.TextCommand):
+    """Erase the whole view in a single edit"""
+    def run(self, edit):
+        self.view.erase(edit, sublime.Region(0, self.view.size()))
+
+
+#----------------------------------------------------------------
+class DeepChatEventListener(sublime_plugin.EventListener):
+    def on_activated_async(self, view):
+        # Status is set lazily on the view that gains focus
+        window = view.window()
+        if window:
+            status_text = _window_status.get(window.id())
+            if status_text:
+                view.set_status('deepchat_model', status_text)
+
+
 #----------------------------------------------------------------
 class DeepChatRefreshCommand(sublime_plugin.WindowCommand):
     def run(self):
@@ -61,102 +308,411 @@ class DeepChatSelectModelCommand(sublime_plugin.WindowCommand):
 
 
 #----------------------------------------------------------------
-class SessionManager:
-    """Manage chat sessions"""
-    
-    @staticmethod
-    def get_sessions_dir(window=None):
-        """Get or create sessions directory - prefer project root"""
-        # Try project root first
-        if window:
-            folders = window.folders()
-            if folders:
-                project_dir = os.path.join(folders[0], '.deepchat', 'sessions')
-                os.makedirs(project_dir, exist_ok=True)
-                return project_dir
-        
+def _find_line(text, line, pos):
+    """Index of the first line equal to `line` at or after pos (a line start), or -1"""
+    size = len(text)
+    end = pos + len(line)
+    if text.startswith(line, pos) and (end == size or text[end] == '\n'):
+        return pos
+    needle = '\n' + line
+    i = text.find(needle, pos)
+    while i >= 0:
+        end = i + len(needle)
+        if end == size or text[end] == '\n':
+            return i + 1
+        i = text.find(needle, end)
+    return -1
+
+#----------------------------------------------------------------
+def _dumps_json(data):
+    """Serialize data as indented UTF-8 JSON, via orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _format_function_results(function_results):
+    """History entry text reporting tool call results"""
+    return "\n\nFunction execution results:\n{}".format(_dumps_json(function_results).decode('utf-8'))
+
+def _read_json_file(file_path):
+    """Read a JSON file, via orjson when available"""
+    with open(file_path, 'rb') as f:
+        return _loads_json(f.read())
+
+def _loads_json(raw):
+    """Parse UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode('utf-8'))
+
+def _dumps_json_line(data):
+    """Serialize data as one compact UTF-8 JSON line"""
+    if orjson is not None:
+        return orjson.dumps(data) + b'\n'
+    return json.dumps(data, ensure_ascii=False).encode('utf-8') + b'\n'
+
+def _dumps_json_compact(data):
+    """Serialize data as compact UTF-8 JSON, via orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+def _replace_file(file_path, raw):
+    """Write bytes atomically through a temp file and os.replace"""
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(tmp_path, file_path)
+
+def _replace_json_file(file_path, data):
+    _replace_file(file_path, _dumps_json(data))
+
+if msgspec is not None:
+    class SessionModel(msgspec.Struct, omit_defaults=True):
+        """Schema of a .session.json file"""
+        id: str
+        created_at: typing.Optional[str] = None
+        updated_at: typing.Optional[str] = None
+        active_model: typing.Optional[str] = None
+        history: typing.List[dict] = []  # only in older session files
+        added_files: dict = {}
+        metadata: dict = {}
+
+def _encode_session(session_data):
+    """Serialize a session dict, validated through SessionModel when msgspec is available"""
+    if msgspec is not None:
+        return msgspec.json.format(msgspec.json.encode(SessionModel(**session_data)), indent=2)
+    return _dumps_json(session_data)
+
+def _decode_session(raw):
+    """Parse a session file into a dict; raises ValueError on malformed data"""
+    if msgspec is not None:
+        try:
+            return msgspec.to_builtins(msgspec.json.decode(raw, type=SessionModel))
+        except msgspec.MsgspecError as e:
+            raise ValueError(str(e))
+    return _loads_json(raw)
+
+def _read_session_file(file_path):
+    with open(file_path, 'rb') as f:
+        return _decode_session(f.read())
+
+#----------------------------------------------------------------
+_SESSION_INDEX_FILE = 'index.json'
+_session_lock = threading.RLock()  # guards session files, index.json and the caches below
+_index_cache = {}  # sessions dir -> summary index (mirror of index.json)
+_unflushed_indexes = set()  # sessions dirs whose index.json lags behind _index_cache
+_transcript_contents = {}  # (sessions dir, id) -> long contents already in the transcript
+_DEDUP_MIN_CHARS = 256  # shorter repeated contents are cheaper to store inline
+_MISSING_CONTENT = "[Content lost: not found in the session transcript]"
+_sessions_dir_cache = {}  # (window id, first folder) -> sessions dir
+
+def get_sessions_dir(window=None):
+    """Get or create sessions directory - prefer project root"""
+    # Keyed on the folder too, so adding a project folder moves new sessions there
+    folders = window.folders() if window else None
+    cache_key = (window.id() if window else None, folders[0] if folders else None)
+    sessions_dir = _sessions_dir_cache.get(cache_key)
+    if sessions_dir:
+        return sessions_dir
+
+    # Try project root first
+    if folders:
+        sessions_dir = os.path.join(folders[0], '.deepchat', 'sessions')
+    else:
         # Fallback to user directory
         user_dir = sublime.packages_path()
         sessions_dir = os.path.join(user_dir, 'User', 'DeepChat', 'sessions')
-        os.makedirs(sessions_dir, exist_ok=True)
-        return sessions_dir
-    
-    @staticmethod
-    def generate_session_id(name=None):
-        """Generate unique session ID"""
-        if name:
-            return re.sub(r'[^\w\-]', '_', name.lower())
-        else:
-            return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    os.makedirs(sessions_dir, exist_ok=True)
+    _sessions_dir_cache[cache_key] = sessions_dir
+    return sessions_dir
+
+def generate_session_id(name=None):
+    """Generate unique session ID"""
+    if name:
+        return _SESSION_ID_SANITIZER.sub('_', name.lower())
+    else:
+        return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+def _session_path(sessions_dir, session_id):
+    return os.path.join(sessions_dir, '{}.session.json'.format(session_id))
+
+def _transcript_path(sessions_dir, session_id):
+    return os.path.join(sessions_dir, '{}.session.jsonl'.format(session_id))
+
+def _content_key(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def _encode_transcript(messages, seen):
+    """(lines, new long contents) for messages; contents already in `seen` or
+    earlier in messages become content_ref. `seen` itself is left alone so
+    the caller only records the new contents once they're on disk."""
+    lines = []
+    added = set()
+    for msg in messages:
+        content = msg.get('content')
+        if isinstance(content, str) and len(content) >= _DEDUP_MIN_CHARS:
+            if content in seen or content in added:
+                msg = {k: v for k, v in msg.items() if k != 'content'}
+                msg['content_ref'] = _content_key(content)
+            else:
+                added.add(content)
+        lines.append(_dumps_json_line(msg))
+    return lines, added
+
+def save_session(session_id, data, window=None):
+    """Save session metadata and rewrite its transcript"""
+    sessions_dir = get_sessions_dir(window)
+    with _session_lock:
+        try:
+            return _write_session(sessions_dir, session_id, data)
+        except FileNotFoundError:
+            # The sessions directory was removed outside the plugin
+            os.makedirs(sessions_dir, exist_ok=True)
+            return _write_session(sessions_dir, session_id, data)
+
+def _write_session(sessions_dir, session_id, data):
+    lines, added = _encode_transcript(data.get('history', []), ())
+    _replace_file(_transcript_path(sessions_dir, session_id), b''.join(lines))
+    _transcript_contents[(sessions_dir, session_id)] = added
+    return _save_session_meta(sessions_dir, session_id, data, flush_index=True)
+
+def append_session_messages(session_id, start, data, window=None):
+    """Append data['history'][start:] to the transcript and refresh the metadata"""
+    sessions_dir = get_sessions_dir(window)
+    history = data.get('history', [])
+    with _session_lock:
+        seen = _transcript_contents.get((sessions_dir, session_id))
+        if seen is None:
+            # Nothing written to this transcript in this run, so there's no
+            # telling what it holds - write it all
+            return save_session(session_id, data, window)
+        lines, added = _encode_transcript(history[start:], seen)
+        try:
+            if lines:
+                with open(_transcript_path(sessions_dir, session_id), 'ab') as f:
+                    f.write(b''.join(lines))
+                # Only now can later messages refer to these contents
+                seen |= added
+            # index.json is left to the next full save or listing; its mtime
+            # check re-reads this session's metadata if we never get there
+            return _save_session_meta(sessions_dir, session_id, data, flush_index=False)
+        except FileNotFoundError:
+            # The sessions directory was removed outside the plugin, and the
+            # earlier messages with it - write everything again
+            os.makedirs(sessions_dir, exist_ok=True)
+            return save_session(session_id, data, window)
+        except Exception:
+            # Part of the lines may be on disk; the next save rewrites it all
+            _transcript_contents.pop((sessions_dir, session_id), None)
+            raise
+
+def _save_session_meta(sessions_dir, session_id, data, flush_index):
+    """Write the small metadata file (everything but the history)"""
+    file_path = _session_path(sessions_dir, session_id)
+    created_at = data.get('created_at')
+    if not created_at:
+        # The in-memory index knows it for any session saved or listed before
+        with _session_lock:
+            created_at = _load_index(sessions_dir).get(session_id, {}).get('created_at')
+    if not created_at:
+        try:
+            created_at = _read_session_file(file_path).get('created_at')
+        except (OSError, ValueError):
+            pass
+
+    session_data = {
+        'id': session_id,
+        'created_at': created_at or datetime.now().isoformat(),
+        'updated_at': datetime.now().isoformat(),
+        'active_model': data.get('active_model'),
+        'added_files': data.get('added_files', {}),
+        'metadata': data.get('metadata', {})
+    }
     
-    @staticmethod
-    def save_session(session_id, data, window=None):
-        """Save session to file"""
-        sessions_dir = SessionManager.get_sessions_dir(window)
-        file_path = os.path.join(sessions_dir, '{}.session.json'.format(session_id))
-        
-        session_data = {
-            'id': session_id,
-            'created_at': data.get('created_at', datetime.now().isoformat()),
-            'updated_at': datetime.now().isoformat(),
-            'active_model': data.get('active_model'),
-            'history': data.get('history', []),
-            'added_files': data.get('added_files', {}),
-            'metadata': data.get('metadata', {})
-        }
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, indent=2, ensure_ascii=False)
-        
-        return file_path
+    _replace_file(file_path, _encode_session(session_data))
+    _update_index(sessions_dir, session_id, {
+        'id': session_id,
+        'mtime': os.stat(file_path).st_mtime,
+        'created_at': session_data['created_at'],
+        'updated_at': session_data['updated_at'],
+        'model': session_data['active_model'],
+        'message_count': len(data.get('history', []))
+    }, flush=flush_index)
     
-    @staticmethod
-    def load_session(session_id, window=None):
-        """Load session from file"""
-        sessions_dir = SessionManager.get_sessions_dir(window)
-        file_path = os.path.join(sessions_dir, '{}.session.json'.format(session_id))
-        if not os.path.exists(file_path):
-            return None
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    return file_path
+
+def load_session(session_id, window=None):
+    """Load session from file"""
+    sessions_dir = get_sessions_dir(window)
+    file_path = _session_path(sessions_dir, session_id)
+    if not os.path.exists(file_path):
+        return None
     
-    @staticmethod
-    def list_sessions(window=None):
-        """List all available sessions"""
-        sessions_dir = SessionManager.get_sessions_dir(window)
-        sessions = []
-        
-        for filename in os.listdir(sessions_dir):
-            if filename.endswith('.session.json'):
-                file_path = os.path.join(sessions_dir, filename)
+    session_data = _read_session_file(file_path)
+    # Older session files keep the history inline
+    if not session_data.get('history'):
+        session_data['history'] = _read_transcript(_transcript_path(sessions_dir, session_id))
+    session_data.setdefault('metadata', {})['message_count'] = sum(
+        1 for h in session_data['history'] if h['role'] != 'system')
+    return session_data
+
+def _read_transcript(file_path):
+    """Read the transcript line by line, skipping torn lines"""
+    history = []
+    contents = {}  # content key -> long content seen so far
+    missing = 0
+    try:
+        with open(file_path, 'rb') as f:
+            for line in f:
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        sessions.append({
-                            'id': data.get('id'),
-                            'created_at': data.get('created_at'),
-                            'updated_at': data.get('updated_at'),
-                            'model': data.get('active_model'),
-                            'message_count': len(data.get('history', [])),
-                            'file_path': file_path
-                        })
-                except:
+                    msg = _loads_json(line)
+                except ValueError:
+                    continue  # Interrupted write
+                ref = msg.pop('content_ref', None)
+                if ref is not None:
+                    content = contents.get(ref)
+                    if content is None:
+                        # The line holding the content never made it to disk
+                        missing += 1
+                        content = _MISSING_CONTENT
+                    msg['content'] = content
+                else:
+                    content = msg.get('content')
+                    if isinstance(content, str) and len(content) >= _DEDUP_MIN_CHARS:
+                        contents[_content_key(content)] = content
+                history.append(msg)
+    except FileNotFoundError:
+        pass
+    if missing:
+        print("DeepChat: {} message(s) in {} refer to content missing from the transcript".format(
+            missing, file_path))
+    return history
+    
+def list_sessions(window=None, limit=50):
+    """List the most recently updated sessions (all of them if limit is None)"""
+    sessions_dir = get_sessions_dir(window)
+    with _session_lock:
+        index = _load_index(sessions_dir)
+        if _refresh_index(sessions_dir, index) or sessions_dir in _unflushed_indexes:
+            _replace_json_file(os.path.join(sessions_dir, _SESSION_INDEX_FILE), index)
+            _unflushed_indexes.discard(sessions_dir)
+        summaries = list(index.values())
+
+    sort_key = lambda x: x.get('updated_at') or ''
+    if limit is None:
+        summaries.sort(key=sort_key, reverse=True)
+    else:
+        summaries = heapq.nlargest(limit, summaries, key=sort_key)
+
+    sessions = []
+    for summary in summaries:
+        session = dict(summary)
+        session['file_path'] = _session_path(sessions_dir, session['id'])
+        sessions.append(session)
+    return sessions
+
+def _load_index(sessions_dir):
+    """Summary index for sessions_dir, kept in memory after the first read"""
+    index = _index_cache.get(sessions_dir)
+    if index is None:
+        try:
+            index = _read_json_file(os.path.join(sessions_dir, _SESSION_INDEX_FILE))
+        except (OSError, ValueError):
+            index = {}
+        _index_cache[sessions_dir] = index
+    return index
+
+def _update_index(sessions_dir, session_id, summary, flush=True):
+    """Store a session summary in the index, or drop it when summary is None"""
+    with _session_lock:
+        index = _load_index(sessions_dir)
+        if summary is None:
+            index.pop(session_id, None)
+        else:
+            index.setdefault(session_id, {'id': session_id}).update(summary)
+        if flush:
+            _replace_json_file(os.path.join(sessions_dir, _SESSION_INDEX_FILE), index)
+            _unflushed_indexes.discard(sessions_dir)
+        else:
+            _unflushed_indexes.add(sessions_dir)
+
+def _count_transcript_lines(file_path, block_size=65536):
+    """Count transcript messages without parsing or loading the whole file"""
+    count = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            count += block.count(b'\n')
+    return count
+
+def _refresh_index(sessions_dir, index):
+    """Re-read only session files whose mtime changed; returns True if index changed"""
+    changed = False
+    seen = set()
+    
+    with os.scandir(sessions_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.session.json') or not entry.is_file(follow_symlinks=False):
+                continue
+            session_id = entry.name[:-len('.session.json')]
+            seen.add(session_id)
+            try:
+                mtime = entry.stat().st_mtime
+                if index.get(session_id, {}).get('mtime') == mtime:
                     continue
-        
-        sessions.sort(key=lambda x: x.get('updated_at', ''), reverse=True)
-        return sessions
+                data = _read_session_file(entry.path)
+                updated_at = data.get('updated_at')
+                if not updated_at:
+                    # Sort by file modification time instead
+                    updated_at = datetime.fromtimestamp(mtime).isoformat()
+                message_count = len(data.get('history', []))
+                if not message_count:
+                    message_count = _count_transcript_lines(_transcript_path(sessions_dir, session_id))
+                index[session_id] = {
+                    'id': session_id,
+                    'created_at': data.get('created_at'),
+                    'updated_at': updated_at,
+                    'model': data.get('active_model'),
+                    'message_count': message_count,
+                    'mtime': mtime
+                }
+                changed = True
+            except (OSError, ValueError) as e:
+                print("Skipping unreadable session {}: {}".format(entry.name, e))
     
-    @staticmethod
-    def delete_session(session_id, window=None):
-        """Delete a session"""
-        sessions_dir = SessionManager.get_sessions_dir(window)
-        file_path = os.path.join(sessions_dir, '{}.session.json'.format(session_id))
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
-        return False
+    for session_id in [k for k in index if k not in seen]:
+        del index[session_id]
+        changed = True
+    return changed
+    
+def delete_session(session_id, window=None):
+    """Delete a session"""
+    sessions_dir = get_sessions_dir(window)
+    file_path = _session_path(sessions_dir, session_id)
+    
+    if os.path.exists(file_path):
+        _update_index(sessions_dir, session_id, None)
+        _transcript_contents.pop((sessions_dir, session_id), None)
+        os.remove(file_path)
+        try:
+            os.remove(_transcript_path(sessions_dir, session_id))
+        except FileNotFoundError:
+            pass
+        return True
+    return False
+
+#----------------------------------------------------------------
+class SessionManager:
+    """Manage chat sessions (namespace kept for existing callers)"""
+
+    get_sessions_dir = staticmethod(get_sessions_dir)
+    generate_session_id = staticmethod(generate_session_id)
+    save_session = staticmethod(save_session)
+    load_session = staticmethod(load_session)
+    append_session_messages = staticmethod(append_session_messages)
+    list_sessions = staticmethod(list_sessions)
+    delete_session = staticmethod(delete_session)
 
 #----------------------------------------------------------------
 class DeepSeekChatCommand(sublime_plugin.WindowCommand):
@@ -166,6 +722,10 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         self.active_model = None
         self.stopping = False
         self.content_lock = threading.Lock()
+        self._reply_parts = []  # streamed reply pieces, joined on demand
+        self._last_status_text = None
+        self._settings = sublime.load_settings('DeepChat.sublime-settings')
+        self._settings.add_on_change('DeepChat-{}'.format(self.window.id()), self._reload_settings)
         self.load_last_model()
         self.current_session_id = None
         self.auto_save = True 
@@ -175,21 +735,38 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         self.history = []
         self.message_id = 0
         self.labels = {}  # label_name -> message_id
+        self._id_to_index = {}  # message_id -> position in history
+        self._kb_index = None  # position of the knowledge base message
+        self._nonsystem_count = 0  # history entries with role != 'system'
+        self._content_chars = 0  # total length of all history contents
+        self._system_message_cache = None
+        self._system_message_base = None  # system_message setting behind the cache
+        self._functions_prompt_cache = None
+        self._functions_signature = None  # (name, description) pairs behind the cached prompt
+        self._forget_persisted_state()
+        self._force_next_save = False  # save even below auto_save_interval
+        self._commands = self._command_table()
         self.discover_functions()
         self.reset_history()
 
 
     def reset_history(self):
         self.history = [
-            {'role': 'system', 'content': self.get_system_message()},
+            {'role': 'system', 'content': self._get_system_message_cached()},
         ]
         self.added_files = {}
+        self._added_files_view = {}  # added_files as stored in the session file
         self.adding_file = None
         self.result_view = None
         self.history_view = None
         self.current_session_id = None
         self.message_id = 0
         self.labels = {}
+        self._id_to_index = {}
+        self._kb_index = None
+        self._nonsystem_count = 0
+        self._content_chars = len(self.history[0]['content'])
+        self._forget_persisted_state()
         self.try_load_knowledge_base()
 
     def add_message_to_history(self, role, content, label=None):
@@ -203,9 +780,39 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         if label:
             self.labels[label] = self.message_id
             msg['label'] = label
-        self.history.append(msg)
+        self.append_to_history(msg)
+        self._id_to_index[self.message_id] = len(self.history) - 1
         return self.message_id
 
+    def append_to_history(self, msg):
+        """Append a raw history entry (no id), keeping the counters in sync"""
+        self.history.append(msg)
+        self._content_chars += len(msg.get('content', ''))
+        if msg['role'] != 'system':
+            self._nonsystem_count += 1
+
+    def _rebuild_history_index(self):
+        """Recompute id/label lookups after history was replaced or reshuffled"""
+        self._id_to_index = {msg['id']: i for i, msg in enumerate(self.history) if 'id' in msg}
+        self.labels = {msg['label']: msg['id'] for msg in self.history if 'label' in msg}
+        # Keep new ids unique after loading a saved history
+        self.message_id = max(self.message_id, max(self._id_to_index, default=0))
+        self._nonsystem_count = sum(1 for h in self.history if h['role'] != 'system')
+        self._content_chars = sum(len(h.get('content', '')) for h in self.history)
+        # Saved sessions carry their knowledge base message right after the system prompt
+        kb = self.history[1] if len(self.history) > 1 else None
+        if kb and kb['role'] == 'assistant' and 'id' not in kb and kb['content'].startswith(_KB_PREFIX):
+            self._kb_index = 1
+        else:
+            self._kb_index = None
+
+    def _refresh_system_message(self):
+        """Put the current system prompt at the head of history"""
+        if self.history and self.history[0]['role'] == 'system':
+            old_content = self.history[0]['content']
+            self.history[0]['content'] = self._get_system_message_cached()
+            self._content_chars += len(self.history[0]['content']) - len(old_content)
+
     def run(self, **options):
         if options.get('command') == 'set_model':
             self.set_active_model_from_command(options.get('model_name', ''))
@@ -259,25 +866,29 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
                 self.append_message("\n[Error: File not found: {}]\n".format(file_path))
                 return
             
-                        # Get file size for reference
+            # Get file size for reference - in-memory content is measured in
+            # chars to avoid encoding a full copy just to count bytes
             if content is None:
-                file_size = os.path.getsize(file_path)
+                file_size = "{} bytes".format(os.path.getsize(file_path))
             else:
-                file_size = len(content.encode('utf-8'))
+                file_size = "{} chars".format(len(content))
             
             # Add lightweight reference instead of full content
             line = {
                 'role': 'system', 
-                'content': "File available: {} (use view_file to read content)".format(file_path)
+                'content': _FILE_REF_PREFIX + file_path + _FILE_REF_SUFFIX
             }
             
             if file_path in self.added_files:
                 self.append_message("\n[File already attached: {}]\n".format(file_path))
             else:
-                self.history.append(line)
+                self.append_to_history(line)
                 self.adding_file = file_path
                 self.added_files[file_path] = line
-                self.append_message("\n[Attached file: {} ({} bytes)]\n".format(file_path, file_size))
+                self._added_files_view = None
+                # Make the next auto-save write the new file list right away
+                self._force_next_save = True
+                self.append_message("\n[Attached file: {} ({})]\n".format(file_path, file_size))
 
         except Exception as e:
             self.append_message("\n[Error attaching file: {}]\n".format(str(e)))
@@ -287,10 +898,9 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         if not self.added_files:
             self.result_view.run_command('append', {'characters': "\n[No files attached in current session]\n"})
         else:
-            files_text = "\n==== [Attached Files]:\n"
-            for file_path in self.added_files:
-                files_text += "- {}\n".format(file_path)
-            self.result_view.run_command('append', {'characters': files_text})
+            parts = ["\n==== [Attached Files]:\n"]
+            parts.extend("- {}\n".format(file_path) for file_path in self.added_files)
+            self.result_view.run_command('append', {'characters': ''.join(parts)})
 
     # UI methods
     def show_input_panel(self):
@@ -325,6 +935,9 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             sublime.active_window().run_command("move_to_front")
 
     def find_output_view(self):
+        # is_valid() is a cheap flag check - only scan tabs when the view is gone
+        if self.result_view and self.result_view.is_valid():
+            return
         self.result_view = None
         for view in self.window.views():
             if view.name() == "DeepChatResult":
@@ -335,20 +948,19 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         self.open_history_view()
         
         # Clear existing content
-        self.history_view.run_command('select_all')
-        self.history_view.run_command('right_delete')
+        self.history_view.run_command('deep_chat_clear_view')
         
         # Header
-        header = "==== Conversation History ====\n"
-        header += "Session: {}\n".format(self.current_session_id or "unsaved")
-        header += "Model: {}\n".format(self.active_model or "none")
-        header += "Messages: {}\n\n".format(len(self.history))
-        self.history_view.run_command('append', {'characters': header})
+        parts = [
+            "==== Conversation History ====\n",
+            "Session: {}\n".format(self.current_session_id or "unsaved"),
+            "Model: {}\n".format(self.active_model or "none"),
+            "Messages: {}\n\n".format(len(self.history)),
+        ]
         
         # Display each message
         for i, msg in enumerate(self.history):
             role = msg.get('role', 'unknown')
-            content = msg.get('content', '')
             msg_id = msg.get('id', i)
             label = msg.get('label', '')
             
@@ -362,28 +974,24 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             else:
                 prefix = "# [Answer]: "
             
-            # Truncate long content for preview
-            preview = content[:200]
-            if len(content) > 200:
-                preview += "..."
-            
-            msg_text = "{}\n{}\n\n".format(prefix, preview)
-            self.history_view.run_command('append', {'characters': msg_text})
+            parts.append("{}\n{}\n\n".format(prefix, _preview(msg, 200)))
         
         # Footer with instructions
-        footer = "\n==== Commands ====\n"
-        footer += "Use /rewind:<id|label> to rewind to a message\n"
-        self.history_view.run_command('append', {'characters': footer})
+        parts.append("\n==== Commands ====\n")
+        parts.append("Use /rewind:<id|label> to rewind to a message\n")
+        self.history_view.run_command('append', {'characters': ''.join(parts)})
         
         self.show_input_panel()
     def open_history_view(self):
         """Open/focus the history view"""
         # Find existing history view
-        history_view = None
-        for view in self.window.views():
-            if view.name() == "DeepChatHistory":
-                history_view = view
-                break
+        history_view = self.history_view
+        if not history_view or not history_view.is_valid():
+            history_view = None
+            for view in self.window.views():
+                if view.name() == "DeepChatHistory":
+                    history_view = view
+                    break
         
         if not history_view:
             history_view = self.window.new_file()
@@ -400,224 +1008,218 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
     # Command handling
     def on_done(self, message):
         self.find_output_view()
-        clean_message = message.strip().lower()
+        words = message.split(None, 1)
 
-        if not clean_message:
-            return
-            
-        # Command handling
-        if clean_message == '/save':
-            self.handle_save_command(message)
-            return
-        
-        if clean_message == '/load':
-            self.show_session_list('load')
-            return
-        
-        if clean_message == '/sessions':
-            self.show_session_list('info')
+        if not words:
             return
 
-        if clean_message.startswith('/new'):
-            if len(self.history) > 1 and self.current_session_id:
-                self.auto_save_session()
-            
-            # Clear and start fresh
-            if self.result_view:
-                self.result_view.run_command('select_all')
-                self.result_view.run_command('right_delete')
-            
-            self.reset_history()
-            # Refresh system message with functions
-            if self.history and self.history[0]['role'] == 'system':
-                self.history[0]['content'] = self.get_system_message()
-            
-            # Handle optional session name
-            parts = message.split(':', 1)
-            if len(parts) > 1:
-                session_name = parts[1].strip()
-                self.current_session_id = SessionManager.generate_session_id(session_name)
+        # Commands are '/verb' or '/verb:argument' - only the first word
+        # is lowercased, never a whole (possibly huge) pasted prompt
+        verb, colon, _ = words[0].partition(':')
+        verb = verb.lower()
+        handler = self._commands.get(verb)
+        if handler:
+            if verb in _COMMANDS_WITH_TEXT:
+                is_command = True
+            elif colon:
+                is_command = verb in _COMMANDS_WITH_ARG
             else:
-                self.current_session_id = None
-            
-            self.show_current_model()
-            session_info = " ({})".format(self.current_session_id) if self.current_session_id else ""
-            self.append_message("\n[New session started{}]\n".format(session_info))
+                is_command = len(words) == 1 and verb not in _COMMANDS_ARG_REQUIRED
+            if is_command:
+                handler(message)
+                return
+
+        if verb == '/file':
+            # Attach the file, then send the message as a regular one
+            self._cmd_file(message)
+
+        # Regular message
+        self.add_message_to_history('user', message)
+        self.user_message = message
+        self.open_output_view()
+        self.send_message_with_retry()
+        self.show_input_panel()
+
+    def _command_table(self):
+        return {
+            '/save': self.handle_save_command,
+            '/load': self._cmd_load,
+            '/sessions': lambda message: self.show_session_list('info'),
+            '/new': self._cmd_new,
+            '/delete': self._cmd_delete,
+            '/stop': self._cmd_stop,
+            '/testcall': self._cmd_testcall,
+            '/clear': self._cmd_clear,
+            '/history': lambda message: self.display_history(),
+            '/rewind': self._cmd_rewind,
+            '/label': self._cmd_label,
+            '/list': self._cmd_list,
+            '/list_file': self._cmd_list_file,
+            '/system_hint': self._cmd_system_hint,
+            '/settings': self._cmd_settings,
+            '/source': self._cmd_source,
+            '/auto_resume': self._cmd_auto_resume,
+            '/script': lambda message: self.window.run_command('deep_chat_run_script'),
+            '/continue': self._cmd_continue,
+            '/refresh': self._cmd_refresh,
+            '/read': self._cmd_read,
+            '/model': self.handle_model_command,
+        }
+
+    def _cmd_load(self, message):
+        session_id = message.split(':', 1)[1].strip() if ':' in message else ''
+        if session_id:
+            self.load_session(session_id)
             self.show_input_panel()
-            return
+        else:
+            self.show_session_list('load')
+
+    def _cmd_new(self, message):
+        if len(self.history) > 1 and self.current_session_id:
+            self.auto_save_session(force=True)
         
-        if clean_message.startswith('/save:'):
-            session_name = message[6:].strip()
-            self.save_current_session(session_name)
-            self.show_input_panel()
-            return
+        # Clear and start fresh
+        if self.result_view:
+            self.result_view.run_command('deep_chat_clear_view')
         
-        if clean_message.startswith('/load:'):
-            session_id = message[6:].strip()
-            self.load_session(session_id)
-            self.show_input_panel()
-            return
+        self.reset_history()
+        # Refresh system message with functions
+        self._refresh_system_message()
         
-        if clean_message.startswith('/delete:'):
-            session_id = message[8:].strip()
-            self.delete_session(session_id)
-            self.show_input_panel()
-            return
+        # Handle optional session name
+        parts = message.split(':', 1)
+        if len(parts) > 1:
+            session_name = parts[1].strip()
+            self.current_session_id = generate_session_id(session_name)
+        else:
+            self.current_session_id = None
+        
+        self.show_current_model()
+        session_info = " ({})".format(self.current_session_id) if self.current_session_id else ""
+        self.append_message("\n[New session started{}]\n".format(session_info))
+        self.show_input_panel()
 
-        if clean_message == '/stop':
-            self.stopping = True
-            self.show_input_panel()
-            return
-            
-        if clean_message.startswith('/testcall'):
-            result = self.process_response_with_functions(clean_message[9:].strip())
-            self.append_message("\n[Test Result]: \n {}\n".format(result))
-            return
+    def _cmd_delete(self, message):
+        session_id = message.split(':', 1)[1].strip() if ':' in message else ''
+        self.delete_session(session_id)
+        self.show_input_panel()
 
-        if clean_message == '/clear':
-            if self.result_view:
-                self.result_view.run_command('select_all')
-                self.result_view.run_command('right_delete')
-            self.reset_history()
-            self.show_input_panel()
-            self.show_current_model()
-            return
+    def _cmd_stop(self, message):
+        self.stopping = True
+        self.show_input_panel()
 
-        if clean_message == '/history':
-            self.display_history()
-            return
+    def _cmd_testcall(self, message):
+        _, result = self.process_response_with_functions(message.strip()[9:].strip())
+        self.append_message("\n[Test Result]: \n {}\n".format(result))
 
-        if clean_message.startswith('/rewind:'):
-            target = message[8:].strip()
-            self.rewind_to(target)
-            self.show_input_panel()
-            return
-        
-        if clean_message.startswith('/label:'):
-            parts = message[7:].split(None, 1)
-            if len(parts) == 2:
-                label_name, user_msg = parts
-                self.add_message_to_history('user', user_msg, label=label_name)
-                self.user_message = user_msg
-                self.open_output_view()
-                self.send_message_with_retry()
-            else:
-                self.append_message("\n[Error: /label:name <message>]\n")
-            self.show_input_panel()
-            return
+    def _cmd_clear(self, message):
+        if self.result_view:
+            self.result_view.run_command('deep_chat_clear_view')
+        self.reset_history()
+        self.show_input_panel()
+        self.show_current_model()
 
-        if clean_message == '/list':
-            self.show_model_list()
-            self.show_input_panel()
-            return
+    def _cmd_rewind(self, message):
+        target = message.split(':', 1)[1].strip() if ':' in message else ''
+        self.rewind_to(target)
+        self.show_input_panel()
 
-        if clean_message == '/list_file':
-            self.show_file_list()
-            self.show_input_panel()
-            return
-        
-        if clean_message == '/system_hint':
-            self.append_message("\n[System Hint]:\n{}\n".format(
-                self.get_system_message()
-            ))
-            return
+    def _cmd_label(self, message):
+        parts = message.split(':', 1)[1].split(None, 1) if ':' in message else []
+        if len(parts) == 2:
+            label_name, user_msg = parts
+            self.add_message_to_history('user', user_msg, label=label_name)
+            self.user_message = user_msg
+            self.open_output_view()
+            self.send_message_with_retry()
+        else:
+            self.append_message("\n[Error: /label:name <message>]\n")
+        self.show_input_panel()
 
-        if clean_message == '/settings':
-            settings_path = os.path.join(
-                sublime.packages_path(), 
-                'User', 
-                'DeepChat.sublime-settings'
-            )
-            if not os.path.exists(settings_path):
-                os.makedirs(os.path.dirname(settings_path), exist_ok=True)
-                default_settings = sublime.load_resource(
-                    'Packages/DeepChat/DeepChat.sublime-settings'
-                )
-                with open(settings_path, 'w', encoding='utf-8') as f:
-                    f.write(default_settings)
-            self.window.open_file(settings_path)
-            return
-            
-        if clean_message == '/source':
-            source_path = os.path.join(
-                sublime.packages_path(), 
-                'DeepChat', 
-                'chat.py'
+    def _cmd_list(self, message):
+        self.show_model_list()
+        self.show_input_panel()
+
+    def _cmd_list_file(self, message):
+        self.show_file_list()
+        self.show_input_panel()
+
+    def _cmd_system_hint(self, message):
+        self.append_message("\n[System Hint]:\n{}\n".format(
+            self._get_system_message_cached()
+        ))
+
+    def _cmd_settings(self, message):
+        settings_path = os.path.join(
+            sublime.packages_path(), 
+            'User', 
+            'DeepChat.sublime-settings'
+        )
+        if not os.path.exists(settings_path):
+            os.makedirs(os.path.dirname(settings_path), exist_ok=True)
+            default_settings = sublime.load_resource(
+                'Packages/DeepChat/DeepChat.sublime-settings'
             )
-            self.window.open_file(source_path)
-            return
+            with open(settings_path, 'w', encoding='utf-8') as f:
+                f.write(default_settings)
+        self.window.open_file(settings_path)
+
+    def _cmd_source(self, message):
+        source_path = os.path.join(
+            sublime.packages_path(), 
+            'DeepChat', 
+            'chat.py'
+        )
+        self.window.open_file(source_path)
 
-        if clean_message == '/auto_resume':
-            settings = sublime.load_settings('DeepChat.sublime-settings')
-            current = settings.get('auto_resume', True)
-            settings.set('auto_resume', not current)
-            sublime.save_settings('DeepChat.sublime-settings')
-            self.append_message("\n[Auto-resume: {}]\n".format('ON' if not current else 'OFF'))
+    def _cmd_auto_resume(self, message):
+        settings = self._settings
+        current = settings.get('auto_resume', True)
+        settings.set('auto_resume', not current)
+        sublime.save_settings('DeepChat.sublime-settings')
+        self.append_message("\n[Auto-resume: {}]\n".format('ON' if not current else 'OFF'))
+        self.show_input_panel()
+
+    def _cmd_continue(self, message):
+        if self.script_runner.current_script:
+            self.script_runner.execute_next_step()
+        else:
+            self.append_message("\n[No active script to continue]\n")
             self.show_input_panel()
-            return
 
-        if clean_message == '/script':
-            self.window.run_command('deep_chat_run_script')
-            return
+    def _cmd_refresh(self, message):
+        self.discover_functions()
+        self.append_message("\n[Refreshed functions: {} found]\n".format(
+            len(self.available_functions)
+        ))
+        if self.available_functions:
+            print("found tool functions:")
+            for cmd_name in self.available_functions.keys():
+                print("  - {}\n".format(cmd_name))
         
-        if clean_message == '/continue':
-            if self.script_runner.current_script:
-                self.script_runner.execute_next_step()
-            else:
-                self.append_message("\n[No active script to continue]\n")
-                self.show_input_panel()
-            return
-        if clean_message == '/refresh':
-            self.discover_functions()
-            self.append_message("\n[Refreshed functions: {} found]\n".format(
-                len(self.available_functions)
-            ))
-            if self.available_functions:
-                print("found tool functions:")
-                for cmd_name in self.available_functions.keys():
-                    print("  - {}\n".format(cmd_name))
-            
-            # Reload knowledge base
-            kb_loaded = self.reload_knowledge_base()
-            if kb_loaded:
-                self.append_message("[Knowledge base reloaded]\n")
-            
-            self.show_input_panel()
-            return
+        # Reload knowledge base
+        kb_loaded = self.reload_knowledge_base()
+        if kb_loaded:
+            self.append_message("[Knowledge base reloaded]\n")
         
-        if clean_message.startswith('/read'):
-            active_view = self.window.active_view()
-            if active_view and active_view.file_name():
-                file_path = active_view.file_name()
-                file_content = active_view.substr(sublime.Region(0, active_view.size()))
-                self.add_file(file_path, file_content)
-                self.append_message("\n[Read active file: {}]\n".format(file_path))
-            else:
-                self.append_message("\n[No active file to read]\n")
-            self.show_input_panel()
-            return
+        self.show_input_panel()
 
-        if clean_message.startswith('/model'):
-            self.handle_model_command(message)
-            return
+    def _cmd_read(self, message):
+        active_view = self.window.active_view()
+        if active_view and active_view.file_name():
+            file_path = active_view.file_name()
+            file_content = active_view.substr(sublime.Region(0, active_view.size()))
+            self.add_file(file_path, file_content)
+            self.append_message("\n[Read active file: {}]\n".format(file_path))
+        else:
+            self.append_message("\n[No active file to read]\n")
+        self.show_input_panel()
 
-        if clean_message.startswith('/file:'):
-            file_path = message[6:].strip()
+    def _cmd_file(self, message):
+        if ':' in message:
+            file_path = message.split(':', 1)[1].strip()
             self.add_file(file_path)
-            # self.show_input_panel()
-            # return
-
-        if clean_message.startswith('/file'):
-            self.handle_file_command()
-            # self.show_input_panel()
-            # return
-
-        # Regular message
-        self.add_message_to_history('user', message)
-        self.user_message = message
-        self.open_output_view()
-        self.send_message_with_retry()
-        self.show_input_panel()
+        self.handle_file_command()
 
     
     def rewind_to(self, target):
@@ -629,22 +1231,12 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             else:
                 target_id = int(target)
             
-            # Find message with target ID
-            new_history = []
-            found = False
-            for msg in self.history:
-                new_history.append(msg)
-                if msg.get('id') == target_id:
-                    found = True
-                    break
+            index = self._id_to_index.get(target_id)
             
-            if found:
-                self.history = new_history
-                # Rebuild labels
-                self.labels = {}
-                for msg in self.history:
-                    if 'label' in msg:
-                        self.labels[msg['label']] = msg['id']
+            if index is not None:
+                self.history = self.history[:index + 1]
+                self._rebuild_history_index()
+                self._forget_persisted_state()
                 
                 self.append_message("\n[Rewound to ID {} ({} messages)]\n".format(
                     target_id, len(self.history)
@@ -694,29 +1286,38 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         # Load project knowledge base
         if folders:
             project_kb = os.path.join(folders[0], '.deepchat', 'knowledge.md')
-            if os.path.exists(project_kb):
-                try:
-                    with open(project_kb, 'r', encoding='utf-8') as f:
-                        kb_contents.append(('project', f.read()))
-                except Exception as e:
-                    print("Failed to load project knowledge: {}".format(e))
+            try:
+                with open(project_kb, 'rb') as f:
+                    kb_contents.append(('project', f.read().decode('utf-8')))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print("Failed to load project knowledge: {}".format(e))
         
         # Load user knowledge base
         user_kb = os.path.join(sublime.packages_path(), 'User', 'DeepChat', 'knowledge.md')
-        if os.path.exists(user_kb):
-            try:
-                with open(user_kb, 'r', encoding='utf-8') as f:
-                    kb_contents.append(('user', f.read()))
-            except Exception as e:
-                print("Failed to load user knowledge: {}".format(e))
+        try:
+            with open(user_kb, 'rb') as f:
+                kb_contents.append(('user', f.read().decode('utf-8')))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Failed to load user knowledge: {}".format(e))
         
         if kb_contents:
             combined = '\n\n---\n\n'.join(content for _, content in kb_contents)
             kb_message = {
                 'role': 'assistant',
-                'content': 'I have access to this knowledge base:\n\n' + combined
+                'content': _KB_PREFIX + combined
             }
-            self.history.insert(1, kb_message)
+            if self._kb_index is not None:
+                self._content_chars -= len(self.history[self._kb_index]['content'])
+                self.history[self._kb_index] = kb_message
+            else:
+                self.history.insert(1, kb_message)
+                self._kb_index = 1
+                self._nonsystem_count += 1
+            self._content_chars += len(kb_message['content'])
             
             sources = ', '.join(source for source, _ in kb_contents)
             self.append_message("\n[Loaded knowledge: {}]\n".format(sources))
@@ -726,16 +1327,20 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
 
     def reload_knowledge_base(self):
         """Reload knowledge base by removing old and loading fresh"""
-        # Remove existing knowledge base message (at index 1 if exists)
-        if len(self.history) > 1 and self.history[1]['role'] == 'assistant' and 'knowledge base' in self.history[1]['content']:
-            self.history.pop(1)
+        # Remove existing knowledge base message
+        if self._kb_index is not None:
+            self.history.pop(self._kb_index)
+            self._kb_index = None
         
         # Load fresh knowledge base
-        return self.try_load_knowledge_base()
+        kb_loaded = self.try_load_knowledge_base()
+        self._rebuild_history_index()
+        self._forget_persisted_state()
+        return kb_loaded
 
     def try_auto_resume(self):
         """Try to resume last session"""
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         
         # Check if auto-resume is enabled
         if not settings.get('auto_resume', True):
@@ -749,7 +1354,7 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             return False
         
         # Try to load it
-        session_data = SessionManager.load_session(last_session_id, self.window)
+        session_data = load_session(last_session_id, self.window)
         if not session_data:
             self.try_load_knowledge_base()
             return False
@@ -758,17 +1363,12 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         self.history = session_data.get('history', [])
         self.active_model = session_data.get('active_model')
         self.current_session_id = last_session_id
+        self._rebuild_history_index()
+        self._forget_persisted_state()
         
-        # Restore files
-        self.added_files = {}
-        for file_path, file_data in session_data.get('added_files', {}).items():
-            self.added_files[file_path] = {
-                'role': 'system',
-                'content': file_data.get('content', '')
-            }
+        self._restore_added_files(session_data)
         
-        if self.history and self.history[0]['role'] == 'system':
-            self.history[0]['content'] = self.get_system_message()
+        self._refresh_system_message()
 
         # Display 
         self.open_output_view()
@@ -776,17 +1376,18 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         
         # Show last few messages
         recent_messages = [m for m in self.history if m['role'] != 'system'][-4:]
+        parts = []
         if recent_messages:
-            self.append_message("# [Last messages:]\n\n")
-            self.append_message("```\n")
+            parts.append("# [Last messages:]\n\n")
+            parts.append("```\n")
             for msg in recent_messages:
                 prefix = "- Q: " if msg['role'] == 'user' else "- A: "
-                preview = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
-                preview = preview.replace('```', '`')
-                self.append_message("{}{}\n".format(prefix, preview))
-            self.append_message("```\n")
+                preview = _preview(msg, 100).replace('```', '`')
+                parts.append("{}{}\n".format(prefix, preview))
+            parts.append("```\n")
         
-        self.append_message("\n")
+        parts.append("\n")
+        self.append_message(''.join(parts))
         self.update_status_bar()
         self.show_input_panel()
         return True
@@ -799,69 +1400,107 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         
         # Generate or use existing session ID
         if session_name:
-            session_id = SessionManager.generate_session_id(session_name)
+            session_id = generate_session_id(session_name)
         elif self.current_session_id:
             session_id = self.current_session_id
         else:
-            session_id = SessionManager.generate_session_id()
-        
-        # Prepare session data
-        session_data = {
-            'active_model': self.active_model,
-            'history': self.history,
-            'added_files': {k: {'content': v['content']} for k, v in self.added_files.items()},
-            'metadata': {
-                'message_count': len([h for h in self.history if h['role'] != 'system']),
-                'file_count': len(self.added_files)
-            }
-        }
-        
-        # Load existing session to preserve created_at
-        existing = SessionManager.load_session(session_id)
-        if existing:
-            session_data['created_at'] = existing.get('created_at')
+            session_id = generate_session_id()
         
-        # Save
-        file_path = SessionManager.save_session(session_id, session_data, self.window)
+        # Save (created_at is kept from an existing session file)
+        save_session(session_id, self._session_snapshot(), self.window)
         self.current_session_id = session_id
+        self._mark_persisted()
         
         # Save as last session for auto-resume
-        settings = sublime.load_settings('DeepChat.sublime-settings')
-        settings.set('last_session_id', session_id)
-        sublime.save_settings('DeepChat.sublime-settings')
+        self._remember_last_session(session_id)
         
         self.append_message("\n[Session saved: {}]\n".format(session_id))
 
-    def auto_save_session(self):
-        """Auto-save current session"""
+    def auto_save_session(self, force=False):
+        """Auto-save current session every auto_save_interval messages (always when forced)"""
         if not self.current_session_id:
             # Create new session on first auto-save
-            self.current_session_id = SessionManager.generate_session_id()
+            self.current_session_id = generate_session_id()
         
         if len(self.history) > 1:  # Has messages beyond system message
-            session_data = {
-                'active_model': self.active_model,
-                'history': self.history,
-                'added_files': {k: {'content': v['content']} for k, v in self.added_files.items()},
-                'metadata': {
-                    'message_count': len([h for h in self.history if h['role'] != 'system']),
-                    'file_count': len(self.added_files)
-                }
-            }
-            
-            existing = SessionManager.load_session(self.current_session_id, self.window)
-            if existing:
-                session_data['created_at'] = existing.get('created_at')
-            
-            SessionManager.save_session(self.current_session_id, session_data, self.window)
+            force = force or self._force_next_save
+            self._force_next_save = False
+            if self._can_append():
+                # Only append what was added since the last save
+                pending = len(self.history) - self._persisted_count
+                interval = max(1, self._settings.get('auto_save_interval', 1))
+                if (pending >= interval or (force and pending)
+                        or self._persisted_model != self.active_model):
+                    append_session_messages(
+                        self.current_session_id, self._persisted_count,
+                        self._session_snapshot(), self.window)
+                    self._mark_persisted()
+            else:
+                save_session(self.current_session_id, self._session_snapshot(), self.window)
+                self._mark_persisted()
+
+            self._remember_last_session(self.current_session_id)
 
-            settings = sublime.load_settings('DeepChat.sublime-settings')
-            settings.set('last_session_id', self.current_session_id)
+    def _remember_last_session(self, session_id):
+        """Store the session for auto-resume, only touching disk when it changed"""
+        if self._settings.get('last_session_id') != session_id:
+            self._settings.set('last_session_id', session_id)
             sublime.save_settings('DeepChat.sublime-settings')
 
+    def _session_snapshot(self):
+        """Session data as passed to save_session"""
+        return {
+            'active_model': self.active_model,
+            'history': self.history,
+            'added_files': self._get_added_files_view(),
+            'metadata': {
+                'message_count': self._nonsystem_count,
+                'file_count': len(self.added_files)
+            }
+        }
+
+    def _get_added_files_view(self):
+        if self._added_files_view is None:
+            self._added_files_view = {k: {'content': v['content']} for k, v in self.added_files.items()}
+        return self._added_files_view
+
+    def _restore_added_files(self, session_data):
+        """Restore attached files from loaded session data"""
+        self.added_files = {}
+        self._added_files_view = None
+        for file_path, file_data in session_data.get('added_files', {}).items():
+            self.added_files[file_path] = {
+                'role': 'system',
+                'content': file_data.get('content', '')
+            }
+
+    def _forget_persisted_state(self):
+        """Make the next auto-save rewrite the full transcript"""
+        self._persisted_session_id = None
+        self._persisted_dir = None
+        self._persisted_model = None
+        self._persisted_count = 0
+
+    def _mark_persisted(self):
+        """Record that the transcript on disk matches the current history"""
+        self._persisted_session_id = self.current_session_id
+        self._persisted_dir = get_sessions_dir(self.window)
+        self._persisted_model = self.active_model
+        self._persisted_count = len(self.history)
+
+    def _can_append(self):
+        """Whether the transcript on disk only lacks newly appended messages"""
+        # A new sessions dir (project folder added) has no transcript yet
+        return (self._persisted_session_id == self.current_session_id
+                and self._persisted_dir == get_sessions_dir(self.window)
+                and self._persisted_count <= len(self.history))
+
     def load_session(self, session_id):
         """Load a saved session"""
-        session_data = SessionManager.load_session(session_id, self.window)
+        if len(self.history) > 1 and self.current_session_id:
+            # Don't lose messages still waiting for the next auto-save
+            self.auto_save_session(force=True)
+        session_data = load_session(session_id, self.window)
         
         if not session_data:
             self.append_message("\n[Session '{}' not found]\n".format(session_id))
@@ -869,54 +1508,47 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         
         # Clear current view
         if self.result_view:
-            self.result_view.run_command('select_all')
-            self.result_view.run_command('right_delete')
+            self.result_view.run_command('deep_chat_clear_view')
         
         # Load session data
         self.history = session_data.get('history', [])
         self.active_model = session_data.get('active_model')
         self.current_session_id = session_id
+        self._rebuild_history_index()
+        self._forget_persisted_state()
         
-        # Restore added files
-        self.added_files = {}
-        for file_path, file_data in session_data.get('added_files', {}).items():
-            self.added_files[file_path] = {
-                'role': 'system',
-                'content': file_data.get('content', '')
-            }
+        self._restore_added_files(session_data)
 
-        if self.history and self.history[0]['role'] == 'system':
-            self.history[0]['content'] = self.get_system_message()
+        self._refresh_system_message()
         
         # Display loaded session
         self.open_output_view()
-        self.append_message("\n[Loaded session: {}]\n".format(session_id))
-        self.append_message("[Created: {}]\n".format(session_data.get('created_at', 'unknown')))
-        self.append_message("[Messages: {}]\n".format(
-            session_data.get('metadata', {}).get('message_count', 0)
-        ))
+        parts = [
+            "\n[Loaded session: {}]\n".format(session_id),
+            "[Created: {}]\n".format(session_data.get('created_at', 'unknown')),
+            "[Messages: {}]\n".format(session_data.get('metadata', {}).get('message_count', 0)),
+        ]
         
         if self.active_model:
-            self.append_message("[Model: {}]\n\n".format(self.active_model))
+            parts.append("[Model: {}]\n\n".format(self.active_model))
         
         # Display conversation history
         for msg in self.history:
             if msg['role'] == 'system':
                 continue
             
-            prefix = "\n--------\n# Q:  " if msg['role'] == 'user' else ""
-            content = msg['content']
-            
             if msg['role'] == 'user':
-                self.append_message("{}{}\n\n".format(prefix, content))
+                parts.append("\n--------\n# Q:  {}\n\n".format(msg['content']))
             else:
-                self.append_message("{}\n\n".format(content))
+                parts.append("{}\n\n".format(msg['content']))
         
+        # One view edit for the whole transcript
+        self.append_message(''.join(parts))
         self.update_status_bar()
 
     def show_session_list(self, action='info'):
         """Show list of available sessions"""
-        sessions = SessionManager.list_sessions(self.window)
+        sessions = list_sessions(self.window)
         
         if not sessions:
             self.append_message("\n[No saved sessions]\n")
@@ -927,16 +1559,17 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         if action == 'info':
             # Just display info
             self.open_output_view()
-            self.append_message("\n==== [Saved Sessions]:\n")
+            parts = ["\n==== [Saved Sessions]:\n"]
             for session in sessions:
                 current_marker = " (current)" if session['id'] == self.current_session_id else ""
-                self.append_message("- {}{}\n".format(session['id'], current_marker))
-                self.append_message("  Updated: {}\n".format(session.get('updated_at', 'unknown')))
-                self.append_message("  Messages: {}, Model: {}\n".format(
+                parts.append("- {}{}\n".format(session['id'], current_marker))
+                parts.append("  Updated: {}\n".format(session.get('updated_at', 'unknown')))
+                parts.append("  Messages: {}, Model: {}\n".format(
                     session.get('message_count', 0),
                     session.get('model', 'unknown')
                 ))
-            self.append_message("\n")
+            parts.append("\n")
+            self.append_message(''.join(parts))
             self.show_input_panel()
         
         elif action == 'load':
@@ -974,7 +1607,7 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
 
     def delete_session(self, session_id):
         """Delete a session"""
-        if SessionManager.delete_session(session_id, self.window):
+        if delete_session(session_id, self.window):
             self.append_message("\n[Session '{}' deleted]\n".format(session_id))
             if self.current_session_id == session_id:
                 self.current_session_id = None
@@ -990,85 +1623,88 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         
         if not os.path.exists(user_path):
             os.makedirs(user_path, exist_ok=True)
-            return
-        
-        for filename in os.listdir(user_path):
-            if not filename.endswith('.py'):
-                continue
+        else:
+            with os.scandir(user_path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.py'):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+                    
+                    # Only re-exec files that changed since they were last loaded
+                    cached = _function_file_cache.get(entry.path)
+                    if cached is None or cached[0] != mtime:
+                        cached = (mtime, self._load_function_file(entry.path))
+                        _function_file_cache[entry.path] = cached
+                    self.available_functions.update(cached[1])
+
+        # Prompts only need rebuilding when the advertised functions changed
+        signature = tuple((name, info['description']) for name, info in self.available_functions.items())
+        if signature != self._functions_signature:
+            self._functions_signature = signature
+            self._functions_prompt_cache = None
+            self._system_message_cache = None
+            self._refresh_system_message()
+
+    def _load_function_file(self, file_path):
+        """Exec a DeepChatFunctions file and collect the functions it defines"""
+        functions = {}
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                code = f.read()
             
-            file_path = os.path.join(user_path, filename)
+            namespace = {'sublime': sublime, 'sublime_plugin': sublime_plugin}
+            exec(code, namespace)
             
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    code = f.read()
-                
-                namespace = {'sublime': sublime, 'sublime_plugin': sublime_plugin}
-                exec(code, namespace)
+            for item_name, item in namespace.items():
+                if item_name.startswith('_'):
+                    continue
                 
-                for item_name, item in namespace.items():
-                    if item_name.startswith('_'):
-                        continue
-                    
-                    # Handle command classes
-                    if isinstance(item, type) and issubclass(item, sublime_plugin.WindowCommand):
-                        # Convert DeepChatFnOpenFileCommand -> open_file
-                        if item_name.startswith('DeepChatFn') and item_name.endswith('Command'):
-                            func_name = item_name[10:-7]  # Strip prefix/suffix
-                            # Convert CamelCase to snake_case
-                            func_name = re.sub(r'(?<!^)(?=[A-Z])', '_', func_name).lower()
-                            
-                            doc = getattr(item, '__doc__', None) or 'No description'
-                            self.available_functions[func_name] = {
-                                'description': doc.strip(),
-                                'type': 'command',
-                                'class': item
-                            }
-                    
-                    # Handle plain functions
-                    elif callable(item):
+                # Handle command classes
+                if isinstance(item, type) and issubclass(item, sublime_plugin.WindowCommand):
+                    # Convert DeepChatFnOpenFileCommand -> open_file
+                    if item_name.startswith('DeepChatFn') and item_name.endswith('Command'):
+                        func_name = item_name[10:-7]  # Strip prefix/suffix
+                        # Convert CamelCase to snake_case
+                        func_name = _CAMEL_SPLIT.sub('_', func_name).lower()
+                        
                         doc = getattr(item, '__doc__', None) or 'No description'
-                        self.available_functions[item_name] = {
+                        functions[func_name] = {
                             'description': doc.strip(),
-                            'type': 'function',
-                            'callable': item
+                            'type': 'command',
+                            'class': item
                         }
-                        
-            except Exception as e:
-                print("Error loading function {}: {}".format(filename, e))
-
-        if self.history and self.history[0]['role'] == 'system':
-            self.history[0]['content'] = self.get_system_message()
+                
+                # Handle plain functions
+                elif callable(item):
+                    doc = getattr(item, '__doc__', None) or 'No description'
+                    functions[item_name] = {
+                        'description': doc.strip(),
+                        'type': 'function',
+                        'callable': item
+                    }
+                    
+        except Exception as e:
+            print("Error loading function {}: {}".format(os.path.basename(file_path), e))
+        return functions
 
     def get_functions_prompt(self):
         if not self.available_functions:
             return ""
         
-        prompt = "\n\nYou have access to these functions:\n"
-        for cmd_name, info in self.available_functions.items():
-            prompt += "\n\n>>>> {}: {}".format(cmd_name, info['description'])
-        
-        prompt += "\n\nTo call a function, use this format:"
-        prompt += "\n\n```"
-        prompt += "\n<toolfunction_call>"
-        prompt += "\n@command: function_name"
-        prompt += "\nshort_arg_name: value"
-        prompt += "\nmultiline_arg_name: <<<||"
-        prompt += "\nmultiline value here"
-        prompt += "\ncan have any characters"
-        prompt += "\n||>>>"
-        prompt += "\n</toolfunction_call>"
-        prompt += "\n```"
-
-        prompt += "\nIMPORTANT: function calls are executed after your turn. You MUST cut the answer and wait for user input after a call."
-        prompt += "\nIMPORTANT: Make sure if the call is read-only. If it's a read-only call, use <wait_function_return/> to request user to skip next input."
-        prompt += "\nRequest confirmation before create or edit files. Stop tool function attempts after 3 failures."
-        
-        return prompt
+        if self._functions_prompt_cache is None:
+            parts = ["\n\nYou have access to these functions:\n"]
+            for cmd_name, info in self.available_functions.items():
+                parts.append("\n\n>>>> {}: {}".format(cmd_name, info['description']))
+            parts.append(_FUNCTIONS_PROMPT_USAGE)
+            self._functions_prompt_cache = ''.join(parts)
+        return self._functions_prompt_cache
 
     def parse_function_calls(self, text):
         """Parse simple key-value format instead of JSON"""
-        pattern = r'<toolfunction_call>(.*?)</toolfunction_call>'
-        matches = re.findall(pattern, text, re.DOTALL)
+        matches = _TOOLCALL_FIND.findall(text)
         
         calls = []
         for match in matches:
@@ -1082,60 +1718,50 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
 
     def _parse_kv_format(self, text):
         """Parse key-value format with multiline support"""
-        lines = text.split('\n')
         result = {'args': {}}
-        current_key = None
-        multiline_content = []
-        in_multiline = False
-        
-        for line in lines:
-            if not line:
-                if in_multiline:
-                    multiline_content.append('')
-                continue
+        size = len(text)
+        pos = 0
+        
+        while pos < size:
+            end = text.find('\n', pos)
+            if end < 0:
+                end = size
+            line = text[pos:end]
+            pos = end + 1
             
-            # Check for multiline delimiters
+            # Parse key: value, or the opening of a multiline value
             if line == '<<<||':
-                in_multiline = True
-                multiline_content = []
-                continue
-            elif line == '||>>>':
-                if current_key and in_multiline:
-                    # Strip leading/trailing empty lines
-                    while multiline_content and not multiline_content[0]:
-                        multiline_content.pop(0)
-                    while multiline_content and not multiline_content[-1]:
-                        multiline_content.pop()
-                    content = '\n'.join(multiline_content)
-                    if current_key == '@command':
-                        result['command'] = content
-                    else:
-                        result['args'][current_key] = content
-                in_multiline = False
-                current_key = None
-                continue
-            
-            # Collect multiline content
-            if in_multiline:
-                multiline_content.append(line)
-                continue
-            
-            # Parse key: value
-            if ':' in line:
-                key, value = line.split(':', 1)
+                key = None
+            elif ':' in line:
+                key, _, value = line.partition(':')
                 key = key.strip()
                 value = value.strip()
-                
                 if key == '@command':
                     result['command'] = value
-                else:
-                    # Handle multiline marker
-                    if value == '<<<||':
-                        current_key = key
-                        in_multiline = True
-                        multiline_content = []
-                    else:
-                        result['args'][key] = value
+                    continue
+                if value != '<<<||':
+                    result['args'][key] = value
+                    continue
+            else:
+                continue
+            
+            # Jump straight to the closing delimiter of the multiline block
+            block_end = _find_line(text, '||>>>', pos)
+            if block_end < 0:
+                break  # Unterminated block is dropped
+            block = text[pos:block_end]
+            pos = block_end + len('||>>>') + 1
+            
+            # A repeated opening delimiter restarts the block
+            restart = block.rfind('\n<<<||\n')
+            if restart >= 0:
+                block = block[restart + len('\n<<<||\n'):]
+            elif block.startswith('<<<||\n'):
+                block = block[len('<<<||\n'):]
+            
+            if key:
+                # Strip leading/trailing empty lines
+                result['args'][key] = block.strip('\n')
         
         return result
 
@@ -1167,22 +1793,26 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             return {'success': False, 'error': str(e), 'command': func_name}
 
     def process_response_with_functions(self, response_text):
-        """Process LLM response, execute functions, return results"""
+        """Process LLM response, execute functions, return (calls, results)"""
+        # Most replies contain no calls - skip the regex parse for them
+        if not response_text or '<toolfunction_call>' not in response_text:
+            return [], None
+
         function_calls = self.parse_function_calls(response_text)
         
         if not function_calls:
-            return None
+            return [], None
         
         results = []
         for call in function_calls:
             result = self.execute_function_call(call)
             results.append(result)
         
-        return results
+        return function_calls, results
 
     # Model management
     def set_active_model_from_command(self, model_name):
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         available_models = settings.get('models', {})
 
         if model_name in available_models:
@@ -1192,41 +1822,41 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
                 self.find_output_view()
             if self.result_view:
                 self.result_view.run_command('append', 
-                    {'characters': "\n[Model set to: {}]\n".format(model_name)})
+                    {'characters': _MODEL_SET_TMPL % model_name})
         else:
             if self.result_view:
                 self.result_view.run_command('append', 
-                    {'characters': "\n[Error]: Model '{}' not found in settings.\n".format(model_name)})
+                    {'characters': _MODEL_NOT_FOUND_TMPL % model_name})
         
         self.update_status_bar()
 
     def set_active_model(self, model_name):
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         available_models = settings.get('models', {})
 
         if model_name in available_models:
             self.active_model = model_name
             self.save_last_model(model_name)
             self.result_view.run_command('append', 
-                {'characters': "\n[Model set to: {}]\n".format(model_name)})
+                {'characters': _MODEL_SET_TMPL % model_name})
         else:
             self.result_view.run_command('append', 
-                {'characters': "\n[Error]: Model '{}' not found in settings.\n".format(model_name)})
+                {'characters': _MODEL_NOT_FOUND_TMPL % model_name})
         
         self.update_status_bar()
 
     def show_model_list(self):
         self.open_output_view()
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         available_models = settings.get('models', {})
-        model_list_text = "\n==== [Available Models]:\n"
+        parts = ["\n==== [Available Models]:\n"]
         
         for model_name, model_config in available_models.items():
-            model_list_text += "- {}:   {}\n".format(
-                model_name, model_config.get('description', '...'))
+            parts.append("- {}:   {}\n".format(
+                model_name, model_config.get('description', '...')))
         
-        model_list_text += "\n"
-        self.result_view.run_command('append', {'characters': model_list_text})
+        parts.append("\n")
+        self.result_view.run_command('append', {'characters': ''.join(parts)})
 
     def show_current_model(self):
         if not self.result_view:
@@ -1234,15 +1864,15 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
 
         if self.active_model:
             self.result_view.run_command('append', 
-                {'characters': "\n[Current Model: {}]\n".format(self.active_model)})
+                {'characters': _CURRENT_MODEL_TMPL % self.active_model})
         else:
             self.result_view.run_command('append', 
-                {'characters': "\n[Using default model. /list to show models]\n"})
+                {'characters': _DEFAULT_MODEL_MSG})
 
     # API communication
     def send_message_with_retry(self, max_retries=3):
         """Send message with retry logic"""
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         model_to_use = self.active_model or settings.get('default_model', 'deepseek-chat')
         available_models = settings.get('models', {})
         model_config = available_models.get(model_to_use)
@@ -1297,12 +1927,11 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
     def _prepare_request(self, model_config):
         """Prepare the API request"""        
         # Check request size limit
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         max_tokens = settings.get('max_request_tokens', 100000)
         
         # Rough token estimation: 1 token ≈ 4 chars
-        total_chars = sum(len(msg.get('content', '')) for msg in self.history)
-        estimated_tokens = total_chars // 4
+        estimated_tokens = self._content_chars // 4
         
         if estimated_tokens > max_tokens:
             error_msg = "\n[Error: Request too large (~{} tokens, limit: {}). Use /clear or /new to start fresh]\n".format(
@@ -1340,9 +1969,7 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         if model_config.get("name", self.active_model) == "deepseek-reasoner":
             del data_dict["temperature"]
 
-        data_json = json.dumps(data_dict)
-        data_bytes = data_json.encode('utf-8')
-        return urllib.request.Request(url, data_bytes, headers)
+        return urllib.request.Request(url, _dumps_json_compact(data_dict), headers)
 
     def send_message(self):
         """Entry point - delegates to retry mechanism"""
@@ -1352,37 +1979,29 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
 
     def setup_streaming(self):
         self.response_buffer = b''
-        self.parse_buffer = b''
         self.reply = ''
         self.response_complete = False
         self.timer_running = False
-        self.previous_reply_length = 0
-        self.partial_json = ""
+        self._unflushed = []
+        self._unflushed_chars = 0
+        self._json_splitter = _JsonObjectSplitter()
+        self._last_flush_time = 0
+        self._decoder = json.JSONDecoder()
 
     def _handle_non_streaming_response_sync(self, request):
         """Handle non-streaming response - raises exceptions for retry"""
-        with urllib.request.urlopen(request, timeout=30) as response:
-            response_bytes = response.read()
-            response_str = response_bytes.decode('utf-8')
-            response_json = json.loads(response_str)
+        with _urlopen_keepalive(request, timeout=30) as response:
+            response_json = _loads_json(response.read())
             choices = response_json.get('choices', [])
             
             if choices:
                 reply = choices[0].get('message', {}).get('content', 'No reply from the API.')
-                function_results = self.process_response_with_functions(reply)
-                clean_reply = re.sub(
-                    r'<toolfunction_call>(.{0,100}).*?</toolfunction_call>', 
-                    r'<toolfunction_call>\1...</toolfunction_call>', 
-                    reply, 
-                    flags=re.DOTALL
-                ).strip()
+                _, function_results = self.process_response_with_functions(reply)
+                clean_reply = _TOOLCALL_TRUNC100.sub(_TOOLCALL_TRUNC_REPL, reply).strip()
                 self.add_message_to_history('assistant', clean_reply)
 
                 if function_results:
-                    results_text = "\n\nFunction execution results:\n{}".format(
-                        json.dumps(function_results, indent=2)
-                    )
-                    self.history.append({'role': 'system', 'content': results_text})
+                    self.append_to_history({'role': 'system', 'content': _format_function_results(function_results)})
 
                 self.auto_save_session()
                 
@@ -1397,160 +2016,102 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
             
             sublime.set_timeout(lambda: self.display_response(self.user_message, reply), 0)
 
-    def handle_non_streaming_response(self, request):
-        """Legacy wrapper - no longer used"""
-        try:
-            self._handle_non_streaming_response_sync(request)
-        except urllib.error.HTTPError as e:
-            sublime.error_message("HTTP Error: {} - {}".format(e.code, e.reason))
-        except urllib.error.URLError as e:
-            sublime.error_message("URL Error: {}".format(e.reason))
-        except Exception as e:
-            sublime.error_message("An error occurred: {}".format(str(e)))
-
     # Streaming response handling
-    def stream_response_with_retry(self, request, max_retries=3):
-        """Stream response with retry logic"""
-        for attempt in range(max_retries):
-            try:
-                self.stream_response(request)
-                return
-            except (urllib.error.URLError, socket.error) as e:
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    sublime.set_timeout(lambda: self.append_message(
-                        "\n[Connection error, retrying in {}s...]\n".format(wait_time)
-                    ), 0)
-                    time.sleep(wait_time)
-                else:
-                    sublime.set_timeout(lambda: self.append_message(
-                        "\n[Connection failed after {} attempts: {}]\n".format(max_retries, str(e))
-                    ), 0)
-                    return
-
     def _stream_response_sync(self, request):
         """Stream response synchronously - raises exceptions for retry"""
         self.reply = ''
-        self.previous_reply_length = 0
+        self._unflushed = []
+        self._unflushed_chars = 0
         self.last_update_time = time.time()
         self.response_watchdog_active = True
-        
-        watchdog_thread = threading.Thread(target=self._stream_watchdog)
-        watchdog_thread.daemon = True
-        watchdog_thread.start()
+        sublime.set_timeout(self._check_hang, _STREAM_HANG_TIMEOUT * 1000)
         
         # This will raise exceptions to be caught by retry mechanism
-        with urllib.request.urlopen(request, timeout=30) as response:
-            self.parse_buffer = b''
+        with _urlopen_keepalive(request, timeout=30) as response:
+            # Tighten the read timeout once the stream is open
+            try:
+                response.fp.raw._sock.settimeout(5)
+            except AttributeError:
+                pass
             
-            while True and not self.stopping:
-                self._safely_set_timeout(response, 5)
-                chunk = response.read(1024)
+            # One SSE line at a time; read(n) would wait for n bytes before
+            # handing anything over
+            while not self.stopping:
+                line = response.readline()
                 self.last_update_time = time.time()
                 
-                if not chunk:
-                    self._process_buffer(final=True)
+                if not line:
                     break
                 
-                self.parse_buffer += chunk
-                self._process_buffer()
-                
-                if not self.timer_running:
-                    sublime.set_timeout(self.update_view, 100)
-                    self.timer_running = True
+                self._process_line(line.rstrip(b'\n'))
         
         # Finalize
         self.response_watchdog_active = False
-        self._process_partial_json()
         
-        if self.reply:
-            function_results = self.process_response_with_functions(self.reply)
+        reply = self.reply
+        if reply:
+            function_calls, function_results = self.process_response_with_functions(reply)
             self.response_complete = True
-            clean_reply = re.sub(
-                r'<toolfunction_call>(.{0,150}).*?</toolfunction_call>', 
-                r'<toolfunction_call>\1...</toolfunction_call>', 
-                self.reply, 
-                flags=re.DOTALL
-            ).strip()
-            self.history.append({'role': 'assistant', 'content': clean_reply})
+            clean_reply = _TOOLCALL_TRUNC150.sub(_TOOLCALL_TRUNC_REPL, reply).strip()
+            self.append_to_history({'role': 'assistant', 'content': clean_reply})
             
+            status_text = ''
             if function_results:
                 # Show execution results after response
-                function_calls = self.parse_function_calls(self.reply)
-                for i, result in enumerate(function_results):
-                    call = function_calls[i]
+                status = []
+                for call, result in zip(function_calls, function_results):
                     if result['success']:
-                        sublime.set_timeout(lambda c=call: self.append_message("\n[Executed: {}]\n".format(c.get('command'))), 0)
+                        status.append("\n[Executed: {}]\n".format(call.get('command')))
                     else:
-                        sublime.set_timeout(lambda c=call, r=result: self.append_message("\n[Error: {} - {}]\n".format(c.get('command'), r.get('error'))), 0)
+                        status.append("\n[Error: {} - {}]\n".format(call.get('command'), result.get('error')))
+                status_text = ''.join(status)
                 
-                results_text = "\n\nFunction execution results:\n{}".format(
-                    json.dumps(function_results, indent=2)
-                )
-                self.history.append({'role': 'system', 'content': results_text})
+                self.append_to_history({'role': 'system', 'content': _format_function_results(function_results)})
 
             self.auto_save_session()
-            sublime.set_timeout(lambda: self.update_view(final=True), 0)
+            # The status goes out with the final flush so it can't land
+            # ahead of reply text still held back for batching
+            sublime.set_timeout(lambda: self.update_view(final=True, trailer=status_text), 0)
             sublime.set_timeout(lambda: self._ensure_complete_update(), 300)
             
             # Check for auto-continue
             if self._check_auto_continue():
                 sublime.set_timeout(lambda: self._trigger_auto_continue(), 500)
                 
-    def _process_buffer(self, final=False):
-        if b'\n' in self.parse_buffer:
-            lines = self.parse_buffer.split(b'\n')
-            self.parse_buffer = lines.pop()
-            
-            for line in lines:
-                self._process_line(line)
-        elif final and self.parse_buffer:
-            self._process_line(self.parse_buffer)
-            self.parse_buffer = b''
-
     def _process_line(self, line):
-        if not line.strip():
+        line = line.strip()
+        if not line:
             return
         
         try:
-            line_str = line.decode('utf-8', errors='replace').strip()
-            
-            if line_str.startswith('data: '):
-                if line_str == "data: [DONE]":
+            # SSE framing is checked on the raw bytes; only the JSON payload
+            # is decoded, and by the JSON parser itself
+            if line.startswith(b'data: '):
+                if line == b"data: [DONE]":
                     return
                 
-                json_str = line_str[6:]
-                self._handle_json_content(json_str)
+                self._handle_json_content(line[6:])
             
-            elif line_str.startswith('{'):
-                self._handle_json_content(line_str)
+            elif line.startswith(b'{'):
+                self._handle_json_content(line)
                 
         except Exception as e:
             print("Error processing line: {}".format(str(e)))
 
-    def _handle_json_content(self, json_str):
+    def _handle_json_content(self, raw):
         try:
-            data = json.loads(json_str)
-            self._extract_content(data)
-            
+            data = _loads_json(raw)
         except ValueError:
-            self.partial_json += json_str
-            self._process_partial_json()
-
-    def _process_partial_json(self):
-        if not self.partial_json:
-            return
-            
-        pattern = r'(\{(?:[^{}]|(?:\{(?:[^{}]|(?:\{[^{}]*\}))*\}))*\})'
-        matches = re.findall(pattern, self.partial_json)
-        
-        for match in matches:
-            try:
-                data = json.loads(match)
+            # Object split across lines - decode it once it's complete
+            for obj in self._json_splitter.feed(raw.decode('utf-8', errors='replace')):
+                try:
+                    data = self._decoder.decode(obj)
+                except ValueError:
+                    continue
                 self._extract_content(data)
-                self.partial_json = self.partial_json.replace(match, '', 1)
-            except ValueError:
-                pass
+            return
+
+        self._extract_content(data)
 
     def _trigger_auto_continue(self):
         # Add a system message to prompt continuation
@@ -1568,106 +2129,135 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         return False
 
     def _extract_content(self, data):
+        # OpenAI/compatible format
+        choices = data.get('choices')
+        if choices is not None:
+            text = None
+            if choices:
+                choice = choices[0]
+                delta = choice.get('delta')
+                if delta is not None:
+                    text = delta.get('content')
+                else:
+                    message = choice.get('message')
+                    if message is not None:
+                        text = message.get('content')
+                    else:
+                        text = choice.get('text')
+
+        # Other API formats
+        else:
+            text = data.get('text')
+            if text is None:
+                text = data.get('content')
+            if text is None:
+                text = data.get('completion')
+            if text is None:
+                text = data.get('response')
+
+        if text:
+            self._append_reply(text)
+
+    @property
+    def reply(self):
+        """The reply received so far"""
         with self.content_lock:
-            # OpenAI/compatible format
-            if 'choices' in data:
-                choices = data.get('choices', [])
-                if choices and len(choices) > 0:
-                    choice = choices[0]
-                    
-                    if 'delta' in choice:
-                        delta = choice.get('delta', {})
-                        if 'content' in delta and delta['content'] is not None:
-                            self.reply += delta['content']
-                    
-                    elif 'message' in choice:
-                        message = choice.get('message', {})
-                        if 'content' in message and message['content'] is not None:
-                            self.reply += message['content']
-                    
-                    elif 'text' in choice and choice['text'] is not None:
-                        self.reply += choice['text']
-            
-            # Other API formats
-            elif 'text' in data and data['text'] is not None:
-                self.reply += data['text']
-            
-            elif 'content' in data and data['content'] is not None:
-                self.reply += data['content']
-                
-            elif 'completion' in data and data['completion'] is not None:
-                self.reply += data['completion']
-                
-            elif 'response' in data and data['response'] is not None:
-                self.reply += data['response']
+            parts = self._reply_parts
+            if len(parts) > 1:
+                parts[:] = [''.join(parts)]
+            return parts[0] if parts else ''
 
-    def _stream_watchdog(self):
-        while self.response_watchdog_active:
-            time.sleep(1)
-            
-            elapsed = time.time() - self.last_update_time
-            
-            if elapsed > 15 and not self.response_complete:
-                self.response_watchdog_active = False
-                
-                if self.reply:
-                    sublime.set_timeout(lambda: self._handle_hang(), 0)
-                return
+    @reply.setter
+    def reply(self, text):
+        with self.content_lock:
+            self._reply_parts = [text] if text else []
+
+    def _append_reply(self, text):
+        """Add text to the reply and queue it for the next view update"""
+        with self.content_lock:
+            self._reply_parts.append(text)
+            self._unflushed.append(text)
+            self._unflushed_chars += len(text)
+            # One update in flight at a time; none while nothing arrives
+            schedule = not self.timer_running
+            self.timer_running = True
+        if schedule:
+            sublime.set_timeout(self.update_view, 30)
+
+    def _check_hang(self):
+        """Fires once per hang period instead of polling; re-arms for the
+        time left if data arrived in the meantime"""
+        if not self.response_watchdog_active or self.response_complete:
+            return
+
+        remaining = _STREAM_HANG_TIMEOUT - (time.time() - self.last_update_time)
+        if remaining > 0:
+            sublime.set_timeout(self._check_hang, int(remaining * 1000) + 1)
+            return
+
+        self.response_watchdog_active = False
+        if self._reply_parts:
+            self._handle_hang()
 
     def _handle_hang(self):
         if not self.response_complete:
-            self.reply += "\n\n[Response incomplete - stream timed out]"
+            self._append_reply("\n\n[Response incomplete - stream timed out]")
             self.response_complete = True
             self.stopping = True
             self.add_message_to_history('assistant', self.reply)
             self.auto_save_session()
             self.update_view(final=True)
 
-    def _safely_set_timeout(self, response, timeout=10):
-        try:
-            if hasattr(response, 'fp') and response.fp is not None:
-                if hasattr(response.fp, 'raw') and response.fp.raw is not None:
-                    if hasattr(response.fp.raw, '_sock') and response.fp.raw._sock is not None:
-                        response.fp.raw._sock.settimeout(timeout)
-        except Exception:
-            pass
-
     def _ensure_complete_update(self):
+        if not self.result_view or not self.result_view.is_valid():
+            return
+
         with self.content_lock:
-            final_content = self.reply[self.previous_reply_length:]
+            pending, self._unflushed = self._unflushed, []
+            self._unflushed_chars = 0
             
-        if final_content and self.result_view and self.result_view.is_valid():
-            self.result_view.run_command('append', {'characters': final_content})
-            self.previous_reply_length = len(self.reply)
+        if pending:
+            self.result_view.run_command('append', {'characters': ''.join(pending)})
 
-    def update_view(self, final=False):
+    def update_view(self, final=False, trailer=''):
         try:
             if not self.result_view or not self.result_view.is_valid():
                 self.response_complete = True
                 self.timer_running = False
                 return
                 
+            # Only the queue swap happens under the lock; the stream thread
+            # never waits on the view
+            now = time.time()
+            wait = _FLUSH_MAX_WAIT - (now - self._last_flush_time)
             with self.content_lock:
-                new_content = self.reply[self.previous_reply_length:]
-                current_length = len(self.reply)
+                hold = (not final and self._unflushed
+                        and self._unflushed_chars < _FLUSH_MIN_CHARS and wait > 0)
+                if not hold:
+                    pending, self._unflushed = self._unflushed, []
+                    self._unflushed_chars = 0
+                    self.timer_running = False
+            if hold:
+                # Batch it with the next deltas
+                sublime.set_timeout(self.update_view, max(int(wait * 1000), 1))
+                return
+            new_content = ''.join(pending)
             
+            chunks = []
             if new_content:
-                self.result_view.run_command('append', {'characters': new_content})
-                
-                with self.content_lock:
-                    self.previous_reply_length = current_length
-                    
+                chunks.append(new_content)
+
+            if final and not new_content.endswith('\n'):
+                chunks.append('\n')
+
+            if trailer:
+                chunks.append(trailer)
+
+            if chunks:
+                self.result_view.run_command('deep_chat_append_many', {'chunks': chunks})
+                self._last_flush_time = now
                 self.result_view.sel().clear()
                 self.result_view.sel().add(sublime.Region(self.result_view.size()))
-            
-            if final:
-                if not new_content.endswith('\n'):
-                    self.result_view.run_command('append', {'characters': '\n'})
-                self.timer_running = False
-            else:
-                delay = 30 if new_content else 100
-                self.timer_running = True
-                sublime.set_timeout(self.update_view, delay)
                 
         except Exception as e:
             print("View update error: {}".format(e))
@@ -1702,9 +2292,21 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         
         return self.get_functions_prompt() + path_info
 
+    def _reload_settings(self):
+        """Settings changed on disk or from another window"""
+        # Most changes (last_session_id, last_active_model) don't touch the prompt
+        if self._settings.get('system_message', _DEFAULT_SYSTEM_MESSAGE) != self._system_message_base:
+            self._system_message_cache = None
+
+    def _get_system_message_cached(self):
+        if self._system_message_cache is None:
+            self._system_message_base = self._settings.get('system_message', _DEFAULT_SYSTEM_MESSAGE)
+            self._system_message_cache = self.get_system_message()
+        return self._system_message_cache
+
     def get_system_message(self):
-        settings = sublime.load_settings('DeepChat.sublime-settings')
-        base_message = settings.get('system_message', 'You are a helpful assistant.')
+        settings = self._settings
+        base_message = settings.get('system_message', _DEFAULT_SYSTEM_MESSAGE)
         output = base_message
         output += "\n"
         output += "VERY IMPORTANT: Don't try to make up answers if you don't know. Just say 'I don't know'.\n"
@@ -1713,17 +2315,22 @@ class DeepSeekChatCommand(sublime_plugin.WindowCommand):
         return output
 
     def load_last_model(self):
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         self.active_model = settings.get('last_active_model', None)
         self.update_status_bar()
 
     def save_last_model(self, model_name):
-        settings = sublime.load_settings('DeepChat.sublime-settings')
+        settings = self._settings
         settings.set('last_active_model', model_name)
         sublime.save_settings('DeepChat.sublime-settings')
 
     def update_status_bar(self):
-        status_text = "deepchat:{}".format(self.active_model) if self.active_model else "deepchat:---"
-        for view in self.window.views():
-            view.set_status('deepchat_model', status_text)
+        status_text = _STATUS_TMPL % (self.active_model or '---')
+        if status_text == self._last_status_text:
+            return
+        self._last_status_text = status_text
+        _window_status[self.window.id()] = status_text
+        active_view = self.window.active_view()
+        if active_view:
+            active_view.set_status('deepchat_model', status_text)
 
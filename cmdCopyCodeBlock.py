@@ -1,27 +1,46 @@
 import sublime
 import sublime_plugin
+import bisect
 import re
 
+_CODE_BLOCK_PATTERN = re.compile(r'```.*?\n(.*?)```', re.DOTALL)
+
+# (view id, change count, block starts, block spans) for the last view used
+_code_block_cache = None
+
+def _code_blocks(view):
+    """Sorted (starts, spans) of the code block bodies in view"""
+    global _code_block_cache
+    view_id = view.id()
+    change_count = view.change_count()
+    cached = _code_block_cache
+    if cached is not None and cached[0] == view_id and cached[1] == change_count:
+        return cached[2], cached[3]
+
+    content = view.substr(sublime.Region(0, view.size()))
+    spans = [match.span(1) for match in _CODE_BLOCK_PATTERN.finditer(content)]
+    starts = [start for start, _ in spans]
+    _code_block_cache = (view_id, change_count, starts, spans)
+    return starts, spans
+
 class CopyMarkdownCodeBlockCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         # Get the current cursor position
         cursor_position = self.view.sel()[0].begin()
 
-        # Get the entire document content
-        content = self.view.substr(sublime.Region(0, self.view.size()))
-
         # Find the code block at the cursor position
-        code_block_pattern = re.compile(r'```.*?\n(.*?)```', re.DOTALL)
-        for match in code_block_pattern.finditer(content):
-            start, end = match.span(1)
-            if start <= cursor_position <= end:
-                code_block = match.group(1).strip()
+        starts, spans = _code_blocks(self.view)
+        index = bisect.bisect_right(starts, cursor_position) - 1
+        if index >= 0:
+            start, end = spans[index]
+            if cursor_position <= end:
                 code_block_region = sublime.Region(start, end)
+                code_block = self.view.substr(code_block_region).strip()
                 self.view.sel().clear()
                 self.view.sel().add(code_block_region)
-                
+
                 sublime.set_clipboard(code_block)
                 sublime.status_message("Code block copied to clipboard")
                 return
 
-        sublime.status_message("No code block found at cursor position")
\ No newline at end of file
+        sublime.status_message("No code block found at cursor position")
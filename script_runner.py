@@ -2,17 +2,78 @@ import sublime
 import sublime_plugin
 import os
 import json
+import collections
+import functools
 import re
 import xml.etree.ElementTree as ET
 from datetime import datetime
 
+_VAR_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+@functools.lru_cache(maxsize=256)
+def _compile_condition(condition):
+    """Compiled code for a condition expression, reused by loops and reruns"""
+    return compile(condition, '<script condition>', 'eval')
+
+_script_meta_cache = {}  # script path -> (mtime_ns, (name, description, step count) or None)
+
+def _peek_script_meta(path, default_name):
+    """Read the listing info without building the whole tree (load_script
+    does that when a script is run); still parses to the end so malformed
+    files raise and get left out of the list"""
+    root = None
+    step_count = 0
+    depth = 0
+    steps_state = 0  # 0 before the first <steps>, 1 inside it, 2 after it
+    with open(path, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = elem
+                elif depth == 2 and elem.tag == 'steps' and steps_state == 0:
+                    steps_state = 1
+                elif depth == 3 and steps_state == 1:
+                    step_count += 1
+                continue
+
+            depth -= 1
+            if depth == 1 and steps_state == 1:
+                steps_state = 2
+            if depth >= 1:
+                # Drop bodies (prompts etc.) we've already walked past
+                elem.clear()
+
+    return root.get('name', default_name), root.get('description', ''), step_count
+
+def _read_script_meta(entry):
+    """(name, description, step count) of a script file, None if unreadable"""
+    try:
+        mtime = entry.stat().st_mtime_ns
+    except OSError:
+        return None
+    cached = _script_meta_cache.get(entry.path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        meta = _peek_script_meta(entry.path, entry.name)
+    except Exception as e:
+        # Reported once per change of the file, not on every listing
+        print("DeepChat: can't read script {}: {}".format(entry.path, e))
+        meta = None
+    _script_meta_cache[entry.path] = (mtime, meta)
+    return meta
+
 class ScriptRunner:
     """Handles execution of multi-step chat scripts"""
     
     def __init__(self, chat_command):
         self.chat = chat_command
         self.current_script = None
-        self.current_step = 0
+        self.current_step = 0  # steps executed so far
+        self._pending = collections.deque()  # steps still to run, next first
+        self._last_step = None
         self.script_vars = {}
         self.script_history = []
     
@@ -45,34 +106,30 @@ class ScriptRunner:
         seen_names = set()
         
         for scripts_dir in scripts_dirs:
-            if not os.path.exists(scripts_dir):
+            try:
+                with os.scandir(scripts_dir) as it:
+                    entries = list(it)
+            except OSError:
                 continue
-            print(scripts_dir)
-            for filename in os.listdir(scripts_dir):
-                if filename.endswith('.script.xml'):
-                    file_path = os.path.join(scripts_dir, filename)
-                    try:
-                        tree = ET.parse(file_path)
-                        root = tree.getroot()
-                        name = root.get('name', filename)
-                        
-                        # Skip duplicates (project scripts override global)
-                        if name in seen_names:
-                            continue
-                        seen_names.add(name)
-                        
-                        steps_elem = root.find('steps')
-                        step_count = len(list(steps_elem)) if steps_elem is not None else 0
-                        
-                        scripts.append({
-                            'name': name,
-                            'description': root.get('description', ''),
-                            'file_path': file_path,
-                            'steps': step_count
-                        })
-                    except Exception as e:
-                        print(e)
-                        continue
+            for entry in entries:
+                if not entry.name.endswith('.script.xml'):
+                    continue
+                meta = _read_script_meta(entry)
+                if meta is None:
+                    continue
+                name, description, step_count = meta
+                
+                # Skip duplicates (project scripts override global)
+                if name in seen_names:
+                    continue
+                seen_names.add(name)
+                
+                scripts.append({
+                    'name': name,
+                    'description': description,
+                    'file_path': entry.path,
+                    'steps': step_count
+                })
         
         return scripts
     
@@ -103,6 +160,8 @@ class ScriptRunner:
                 'steps': steps
             }
             self.current_step = 0
+            self._pending = collections.deque(steps)
+            self._last_step = None
             self.script_vars = variables.copy()
             self.script_history = []
             
@@ -163,18 +222,16 @@ class ScriptRunner:
     
     def execute_next_step(self):
         """Execute the next step in the script"""
-        steps = self.current_script.get('steps', [])
-        
-        if self.current_step >= len(steps):
+        if not self._pending:
             self.chat.append_message("\n[Script completed]\n")
             self.current_script = None
             return False
         
-        step = steps[self.current_step]
+        step = self._last_step = self._pending.popleft()
         step_type = step.get('type', 'prompt')
         
         self.chat.append_message("\n[Step {}/{}]\n".format(
-            self.current_step + 1, len(steps)
+            self.current_step + 1, self.current_step + 1 + len(self._pending)
         ))
         
         if step_type == 'prompt':
@@ -194,12 +251,12 @@ class ScriptRunner:
         prompt = self._substitute_vars(prompt)
         
         if step.get('system'):
-            self.chat.history.append({'role': 'system', 'content': prompt})
+            self.chat.append_to_history({'role': 'system', 'content': prompt})
             self.chat.append_message("[System]: {}\n".format(prompt))
             self.current_step += 1
             self.execute_next_step()
         else:
-            self.chat.history.append({'role': 'user', 'content': prompt})
+            self.chat.append_to_history({'role': 'user', 'content': prompt})
             self.chat.user_message = prompt
             self.chat.append_message("\n# Q: {}\n\n".format(prompt))
             
@@ -254,7 +311,7 @@ class ScriptRunner:
         
         try:
             # Simple eval - be careful with user input
-            result = eval(condition, {"__builtins__": {}}, self.script_vars)
+            result = eval(_compile_condition(condition), {"__builtins__": {}}, self.script_vars)
             
             if result:
                 if_steps = step.get('if_true', [])
@@ -271,35 +328,56 @@ class ScriptRunner:
             self.current_script = None
     
     def _inject_steps(self, steps):
-        """Inject steps into current position"""
-        if not steps:
-            return
-        
-        current_steps = self.current_script.get('steps', [])
-        current_steps[self.current_step:self.current_step] = steps
-        self.current_script['steps'] = current_steps
+        """Inject steps to run next"""
+        self._pending.extendleft(reversed(steps))
     
     def _substitute_vars(self, text):
-        """Substitute {{var}} patterns with values"""
+        """Substitute {{var}} patterns with values; text itself if none are known"""
+        if '{{' not in text:
+            return text
+
+        script_vars = self.script_vars
+        found = False
         def replace(match):
+            nonlocal found
             var_name = match.group(1)
-            return str(self.script_vars.get(var_name, match.group(0)))
+            if var_name not in script_vars:
+                return match.group(0)
+            found = True
+            return str(script_vars[var_name])
         
-        return re.sub(r'\{\{(\w+)\}\}', replace, text)
+        result = _VAR_PATTERN.sub(replace, text)
+        return result if found else text
     
     def _substitute_vars_in_dict(self, d):
-        """Recursively substitute variables in dict"""
-        result = {}
+        """Recursively substitute variables in dict; d itself if nothing changed"""
+        result = None
         for k, v in d.items():
             if isinstance(v, str):
-                result[k] = self._substitute_vars(v)
+                new = self._substitute_vars(v)
             elif isinstance(v, dict):
-                result[k] = self._substitute_vars_in_dict(v)
+                new = self._substitute_vars_in_dict(v)
             elif isinstance(v, list):
-                result[k] = [self._substitute_vars(x) if isinstance(x, str) else x for x in v]
+                new = self._substitute_vars_in_list(v)
             else:
-                result[k] = v
-        return result
+                continue
+            if new is not v:
+                if result is None:
+                    result = dict(d)
+                result[k] = new
+        return d if result is None else result
+
+    def _substitute_vars_in_list(self, items):
+        """Substitute variables in the strings of a list; items itself if nothing changed"""
+        result = None
+        for i, x in enumerate(items):
+            if isinstance(x, str):
+                new = self._substitute_vars(x)
+                if new is not x:
+                    if result is None:
+                        result = list(items)
+                    result[i] = new
+        return items if result is None else result
     
     def on_response_complete(self, response):
         """Called when LLM response is complete"""
@@ -313,18 +391,16 @@ class ScriptRunner:
         })
         
         # Check if current step wants to store response
-        steps = self.current_script.get('steps', [])
-        if self.current_step < len(steps):
-            step = steps[self.current_step]
-            if step.get('store_as'):
-                self.script_vars[step['store_as']] = response
+        step = self._last_step
+        if step is not None and step.get('store_as'):
+            self.script_vars[step['store_as']] = response
         
         # Move to next step
         self.current_step += 1
         
         # Check for auto-continue
-        if self.current_step < len(steps):
-            next_step = steps[self.current_step]
+        if self._pending:
+            next_step = self._pending[0]
             if next_step.get('auto_continue', True):
                 sublime.set_timeout(lambda: self.execute_next_step(), 500)
             else: